@@ -0,0 +1,73 @@
+"""Compare the two ways list routes can turn Mongo documents into a response body.
+
+model path: Model(**doc) per document, re-validated against response_model and
+            encoded with the standard json module, as FastAPI does for returned models
+fast path:  ResponseShape defaults/projection applied to the raw documents, encoded
+            with orjson (what the list routes in server.py now do)
+
+Documents come from the synthetic data generator, so no database is needed. Run
+with the server's environment (the module reads its settings on import):
+
+    python bench_serialization.py --items 100 --rounds 2000
+"""
+import argparse
+import json
+import timeit
+from typing import List
+
+from pydantic import TypeAdapter
+
+import server
+
+CASES = {
+    "products": (server.Product, server.PRODUCT_SHAPE, "product"),
+    "orders": (server.Order, server.ORDER_SHAPE, "order"),
+    "suppliers": (server.Supplier, server.SUPPLIER_SHAPE, "supplier"),
+    "reviews": (server.Review, server.REVIEW_SHAPE, "review"),
+}
+
+
+def model_path(model, adapter: TypeAdapter, docs: List[dict]) -> bytes:
+    content = [model(**doc) for doc in docs]
+    validated = adapter.validate_python(content)
+    return json.dumps(adapter.dump_python(validated, mode="json"), ensure_ascii=False,
+                      separators=(",", ":")).encode()
+
+
+def fast_path(shape: server.ResponseShape, docs: List[dict]) -> bytes:
+    return server.render_json(shape.documents(docs))
+
+
+# Documents as the routes read them: projected to the response fields, plus _id
+def generate(kind: str, shape: server.ResponseShape, items: int) -> List[dict]:
+    plan = server.SeedPlan(server.SeedConfig(suppliers=10, products=1000, vendors=100), "bench")
+    return [
+        {"_id": server.ObjectId(), **{key: value for key, value in getattr(plan, kind)(i).items() if key in shape.projection}}
+        for i in range(items)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100, help="documents per response")
+    parser.add_argument("--rounds", type=int, default=1000, help="responses rendered per measurement")
+    parser.add_argument("--case", choices=sorted(CASES), action="append", help="collections to measure (default: all)")
+    args = parser.parse_args()
+
+    print(f"{'case':<10} {'model path':>12} {'fast path':>12} {'speedup':>8}   per {args.items}-item response")
+    for name in args.case or sorted(CASES):
+        model, shape, kind = CASES[name]
+        adapter = TypeAdapter(List[model])
+        docs = generate(kind, shape, args.items)
+
+        # Both paths must produce the same JSON
+        if json.loads(model_path(model, adapter, docs)) != json.loads(fast_path(shape, docs)):
+            raise SystemExit(f"{name}: fast path output differs from the model path")
+
+        slow = min(timeit.repeat(lambda: model_path(model, adapter, docs), number=args.rounds, repeat=3)) / args.rounds
+        fast = min(timeit.repeat(lambda: fast_path(shape, docs), number=args.rounds, repeat=3)) / args.rounds
+        print(f"{name:<10} {slow * 1e6:>10.0f}us {fast * 1e6:>10.0f}us {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,188 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query, Header, Response, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
+import base64
+import re
+import binascii
+import codecs
+import hashlib
+import secrets
+import csv
+import io
+import itertools
+from bisect import bisect_right
+import sys
+import json
+import argparse
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Literal, Optional, get_args
+from collections import Counter, OrderedDict, deque
 import uuid
-from datetime import datetime, timedelta
+import asyncio
+import time
+import threading
+from contextlib import asynccontextmanager
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
 import bcrypt
 import jwt
+import orjson
 from pydantic import EmailStr
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
-mongo_url = "mongodb+srv://durvesh55:<db_password>@micromarketcluster.3o2ghxr.mongodb.net/?retryWrites=true&w=majority&appName=MicroMarketCluster"
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['sample_mflix']]
+MONGO_URL = os.environ['MONGO_URL']
+DB_NAME = os.environ['DB_NAME']
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+# 0 leaves idle connections open indefinitely
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 0))
+# How long an operation waits for a free pooled connection before failing, 0 waits forever
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 20000))
+# Where the public catalog reads (supplier, product and review lists, search) go:
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest.
+# Everything else, transactions included, always reads from the primary.
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+# Comma-separated wire compressors in order of preference, e.g. "zstd,zlib"
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
 
-# Create the main app without a prefix
-app = FastAPI(title="MicroMarket API", description="Digital Wholesale Marketplace API")
+# Connection pool events are published from the driver's threads, hence the lock
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter(dict.fromkeys([
+            "pools_created", "pools_cleared", "connections_created", "connections_closed", "checkouts", "checkout_failures"
+        ], 0))
+        self.failure_reasons = Counter()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def pool_created(self, event):
+        with self.lock:
+            self.counters["pools_created"] += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self.counters["pools_cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            self.counters["connections_created"] += 1
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.counters["connections_closed"] += 1
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        with self.lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.waiting -= 1
+            self.counters["checkout_failures"] += 1
+            self.failure_reasons[event.reason] += 1
+
+    def connection_checked_out(self, event):
+        wait = event.duration or 0.0
+        with self.lock:
+            self.waiting -= 1
+            self.checked_out += 1
+            self.counters["checkouts"] += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def metrics(self) -> dict:
+        with self.lock:
+            checkouts = self.counters["checkouts"]
+            return {
+                **self.counters,
+                "failure_reasons": dict(self.failure_reasons),
+                "open_connections": self.open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "avg_wait_ms": self.wait_seconds / checkouts * 1000 if checkouts else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+pool_stats = PoolStats()
+
+def mongo_client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+    }
+    if MONGO_MAX_IDLE_TIME_MS > 0:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS > 0:
+        options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+# Set by connect_database(), called from the app lifespan or the CLI
+client = None
+db = None
+
+def connect_database():
+    global client, db
+    client = AsyncIOMotorClient(MONGO_URL, event_listeners=[pool_stats], **mongo_client_options())
+    db = client[DB_NAME]
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+CATALOG_READ_PREFERENCE = READ_PREFERENCES[MONGO_READ_PREFERENCE]
+
+# Public catalog reads may lag the primary by the replication delay. The catalog
+# version counters are read the same way, so a lagging page is cached under a
+# lagging version and replaced once the new version replicates.
+def catalog_collection(name: str):
+    return db[name].with_options(read_preference=CATALOG_READ_PREFERENCE)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -32,8 +191,95 @@ api_router = APIRouter(prefix="/api")
 JWT_SECRET = "micromarket_secret_key_2025"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRY_HOURS = 24
+# When enabled, tokens carrying name/user_type claims are trusted without a user lookup.
+# Profile changes then only become visible once the token is reissued.
+JWT_TRUST_CLAIMS = os.environ.get('JWT_TRUST_CLAIMS', 'false').lower() == 'true'
+# Lifetime of the single-use tickets that authenticate EventSource streams
+STREAM_TICKET_TTL_SECONDS = int(os.environ.get('STREAM_TICKET_TTL_SECONDS', 30))
+
+# Authenticated user cache
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 10000))
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Password hashing configuration
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+
+# Keyset pagination for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Public catalog response cache: memory (per process), redis, or none
+CATALOG_CACHE_BACKEND = os.environ.get('CATALOG_CACHE_BACKEND', 'memory')
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', 30))
+# Total size of the cached response bodies, per process
+CATALOG_CACHE_MAX_BYTES = int(os.environ.get('CATALOG_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CATALOG_CACHE_REDIS_URL = os.environ.get('CATALOG_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# Nearby supplier search
+DEFAULT_NEARBY_RADIUS_KM = 5.0
+MAX_NEARBY_RADIUS_KM = 100.0
+
+# Product search
+SEARCH_PRICE_BOUNDARIES = [0, 5, 10, 25, 50, 100, 500]
+SEARCH_SUPPLIER_FACETS = 10
+MAX_SEARCH_SKIP = 1000
+
+# Periodic rebuild of supplier ratings from the reviews collection, 0 disables it
+RATING_RECONCILE_INTERVAL_SECONDS = float(os.environ.get('RATING_RECONCILE_INTERVAL_SECONDS', 0))
+
+# Checkout transactions retried on transient errors (write conflicts, elections)
+CHECKOUT_MAX_RETRIES = 3
+
+# Supplier analytics
+ANALYTICS_TOP_PRODUCTS = 3
+
+# Batch size for bulk rebuilds of denormalized data
+REBUILD_BATCH_SIZE = 1000
+
+# Stock reservations placed by add_to_cart
+RESERVATION_HOLD_MINUTES = float(os.environ.get('RESERVATION_HOLD_MINUTES', 15))
+RESERVATION_SWEEP_INTERVAL_SECONDS = float(os.environ.get('RESERVATION_SWEEP_INTERVAL_SECONDS', 30))
+RESERVATION_SWEEP_BATCH_SIZE = int(os.environ.get('RESERVATION_SWEEP_BATCH_SIZE', 500))
+RESERVATION_RETENTION_HOURS = float(os.environ.get('RESERVATION_RETENTION_HOURS', 24))
+
+# Bulk discount pricing
+PRICING_CACHE_SIZE = int(os.environ.get('PRICING_CACHE_SIZE', 50000))
+PRICING_CACHE_TTL_SECONDS = float(os.environ.get('PRICING_CACHE_TTL_SECONDS', 300))
+MAX_QUOTE_LINES = 5000
+
+# Notification push channel
+NOTIFICATION_STREAM_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_STREAM_QUEUE_SIZE', 100))
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('NOTIFICATION_STREAM_HEARTBEAT_SECONDS', 20))
+
+# Price-drop and new-product notification fan-out
+NOTIFICATION_FANOUT_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_FANOUT_QUEUE_SIZE', 1000))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', 500))
+
+# Notification retention and bulk operations
+NOTIFICATION_READ_TTL_DAYS = float(os.environ.get('NOTIFICATION_READ_TTL_DAYS', 30))
+NOTIFICATION_PAGE_SIZE = 50
+MAX_NOTIFICATION_BULK_IDS = 1000
+
+# Bulk product import
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+MAX_IMPORT_BATCH_SIZE = 5000
+MAX_IMPORT_LINE_LENGTH = 1024 * 1024
+MAX_IMPORT_ERRORS = 1000
+
+# Streaming exports
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+MAX_EXPORT_BATCH_SIZE = 10000
+
+# Cart writes retried when two first writes race to create the same cart
+CART_WRITE_RETRIES = 3
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
 # Define Models
 class User(BaseModel):
@@ -69,6 +315,10 @@ class Supplier(BaseModel):
     rating: float = 4.5
     delivery_rating: float = 4.2
     total_reviews: int = 0
+    rating_histogram: Dict[str, int] = {}  # review count per star, keyed "1".."5"
+    categories: List[str] = []  # maintained from the supplier's products
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class SupplierCreate(BaseModel):
@@ -77,6 +327,18 @@ class SupplierCreate(BaseModel):
     image_url: str
     contact_phone: str
     location: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class NearbySupplier(Supplier):
+    distance_km: float
+
+# Extra keys such as a display label are kept with the tier
+class BulkDiscountTier(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    min_qty: int = Field(..., ge=1)
+    discount: float = Field(..., ge=0, le=1)
 
 class Product(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -98,17 +360,44 @@ class ProductCreate(BaseModel):
     price_per_unit: float
     unit: str
     quantity_available: int
-    bulk_discount_tiers: List[dict] = []
+    bulk_discount_tiers: List[BulkDiscountTier] = []
     image_url: str
     description: str
 
+class ProductSearchHit(Product):
+    score: float
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float] = None
+    count: int
+
+class SupplierFacet(BaseModel):
+    supplier_id: str
+    stall_name: Optional[str] = None
+    count: int
+
+class SearchFacets(BaseModel):
+    categories: List[FacetCount] = []
+    price_ranges: List[PriceBucket] = []
+    suppliers: List[SupplierFacet] = []
+
+class ProductSearchResponse(BaseModel):
+    total: int
+    results: List[ProductSearchHit]
+    facets: SearchFacets
+
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
     category: Optional[str] = None
     price_per_unit: Optional[float] = None
     unit: Optional[str] = None
     quantity_available: Optional[int] = None
-    bulk_discount_tiers: Optional[List[dict]] = None
+    bulk_discount_tiers: Optional[List[BulkDiscountTier]] = None
     image_url: Optional[str] = None
     description: Optional[str] = None
 
@@ -122,7 +411,7 @@ class Review(BaseModel):
 
 class ReviewCreate(BaseModel):
     supplier_id: str
-    rating: int
+    rating: int = Field(..., ge=1, le=5)
     comment: str
 
 class Notification(BaseModel):
@@ -132,8 +421,14 @@ class Notification(BaseModel):
     title: str
     message: str
     is_read: bool = False
+    read_at: Optional[datetime] = None  # read notifications expire NOTIFICATION_READ_TTL_DAYS after this
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class NotificationBulkAction(BaseModel):
+    action: Literal["read", "unread", "delete"]
+    ids: Optional[List[str]] = Field(None, max_length=MAX_NOTIFICATION_BULK_IDS)
+    older_than: Optional[datetime] = None
+
 class CartItem(BaseModel):
     product_id: str
     supplier_id: str
@@ -146,49 +441,1823 @@ class Cart(BaseModel):
     vendor_id: str
     items: List[CartItem] = []
     total_amount: float = 0.0
+    version: int = 0  # bumped by every mutation, used for optimistic concurrency checks
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class CartItemDetails(CartItem):
+    current_price: Optional[float] = None
+    quantity_available: Optional[int] = None
+    supplier_name: Optional[str] = None
+    price_changed: bool = False
+    available: bool = True
+    discount_rate: float = 0.0
+    line_total: float = 0.0
+
+class CartDetails(Cart):
+    items: List[CartItemDetails] = []
+    subtotal: float = 0.0
+    discount_amount: float = 0.0
+    has_changes: bool = False
+
+class OrderItem(CartItem):
+    discount_rate: float = 0.0
+
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     vendor_id: str
     supplier_id: str
-    items: List[CartItem]
+    items: List[OrderItem]
+    subtotal: Optional[float] = None
+    discount_amount: float = 0.0
     total_amount: float
     status: str = "pending"  # pending, confirmed, delivered, cancelled
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class CheckoutResult(BaseModel):
+    orders: List[Order]
+    total_amount: float
+
+class QuoteLine(BaseModel):
+    product_id: str
+    quantity: int = Field(..., gt=0)
+
+class QuoteRequest(BaseModel):
+    items: List[QuoteLine] = Field(..., max_length=MAX_QUOTE_LINES)
+
+class QuotedLine(BaseModel):
+    product_id: str
+    quantity: int
+    name: Optional[str] = None
+    supplier_id: Optional[str] = None
+    unit_price: Optional[float] = None
+    discount_rate: float = 0.0
+    subtotal: float = 0.0
+    discount_amount: float = 0.0
+    total: float = 0.0
+    available: bool = False
+
+class QuoteResponse(BaseModel):
+    items: List[QuotedLine]
+    subtotal: float
+    discount_amount: float
+    total_amount: float
+
+# Password hashing
+# bcrypt is CPU bound and takes ~200ms per call at the default cost, so it runs
+# in a dedicated thread pool (bcrypt releases the GIL) instead of on the event loop.
+class PasswordHasher:
+    def __init__(self, rounds: int, workers: int, max_queue: int):
+        self.rounds = rounds
+        self.max_pending = workers + max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.stats = {
+            "hash_calls": 0,
+            "verify_calls": 0,
+            "rehashes": 0,
+            "rejected": 0,
+            "queue_wait_seconds": 0.0,
+            "hash_seconds": 0.0,
+            "max_queue_wait_seconds": 0.0,
+        }
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Authentication service busy, please retry")
+
+        submitted = time.perf_counter()
+        timings = {}
+
+        def job():
+            started = time.perf_counter()
+            timings["wait"] = started - submitted
+            try:
+                return func(*args)
+            finally:
+                timings["hash"] = time.perf_counter() - started
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+        finally:
+            self.pending -= 1
+            if timings:
+                self.stats["queue_wait_seconds"] += timings["wait"]
+                self.stats["hash_seconds"] += timings.get("hash", 0.0)
+                self.stats["max_queue_wait_seconds"] = max(self.stats["max_queue_wait_seconds"], timings["wait"])
+
+    async def hash(self, password: str) -> str:
+        self.stats["hash_calls"] += 1
+        hashed = await self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        self.stats["verify_calls"] += 1
+        return await self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # bcrypt hashes look like $2b$12$<salt+digest>; the second field is the cost
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def metrics(self) -> dict:
+        calls = self.stats["hash_calls"] + self.stats["verify_calls"] - self.stats["rejected"]
+        return {
+            **self.stats,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "avg_queue_wait_seconds": self.stats["queue_wait_seconds"] / calls if calls else 0.0,
+            "avg_hash_seconds": self.stats["hash_seconds"] / calls if calls else 0.0,
+        }
+
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
 # Helper functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
-def create_jwt_token(user_id: str, email: str) -> str:
+def create_jwt_token(user: User) -> str:
     payload = {
-        "user_id": user_id,
-        "email": email,
+        "user_id": user.id,
+        "email": user.email,
+        "name": user.name,
+        "user_type": user.user_type,
+        "created_at": user.created_at.isoformat(),
         "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRY_HOURS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# In-process LRU cache whose entries also expire after a fixed TTL. max_size bounds
+# the entry count, or the total weight of the entries when weigh is given.
+class TTLCache:
+    def __init__(self, max_size: int, ttl: float, weigh=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.weigh = weigh or (lambda value: 1)
+        self.weight = 0
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self.remove(key)
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def set(self, key, value):
+        weight = self.weigh(value)
+        self.remove(key)
+        if weight > self.max_size:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, value, weight)
+        self.weight += weight
+        while self.weight > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.stats["evictions"] += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+        return entry
+
+    def invalidate(self, key):
+        if self.remove(key) is not None:
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self.stats["invalidations"] += len(self.entries)
+        self.entries.clear()
+        self.weight = 0
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self.entries),
+            "weight": self.weight,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# Must be called by every code path that modifies a user document
+def invalidate_user(user_id: Optional[str] = None):
+    if user_id is None:
+        user_cache.clear()
+    else:
+        user_cache.invalidate(user_id)
+
+def user_from_claims(payload: dict) -> Optional[User]:
+    if not JWT_TRUST_CLAIMS or not all(payload.get(k) for k in ("email", "name", "user_type", "created_at")):
+        return None
+    return User(
+        id=payload["user_id"],
+        email=payload["email"],
+        name=payload["name"],
+        user_type=payload["user_type"],
+        created_at=datetime.fromisoformat(payload["created_at"])
+    )
+
+async def resolve_user(token: str) -> User:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return User(**user)
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    user_id = payload.get("user_id")
+    if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    return user_from_claims(payload) or await load_user(user_id)
+
+async def load_user(user_id: str) -> User:
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    
+    user_doc = await db.users.find_one({"id": user_id}, {"password": 0})
+    if user_doc is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    user = User(**user_doc)
+    user_cache.set(user_id, user)
+    return user
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await resolve_user(credentials.credentials)
+
+# EventSource can't set headers, so streaming endpoints also accept ?ticket= from
+# POST /notifications/stream-token. Tickets are random, live STREAM_TICKET_TTL_SECONDS
+# and are deleted on use, so the long-lived JWT never appears in a URL or access log.
+# Only their hash is stored.
+def stream_ticket_hash(ticket: str) -> str:
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+async def issue_stream_ticket(user_id: str) -> str:
+    ticket = secrets.token_urlsafe(32)
+    await db.stream_tickets.insert_one({
+        "ticket_hash": stream_ticket_hash(ticket),
+        "user_id": user_id,
+        "expires_at": datetime.utcnow() + timedelta(seconds=STREAM_TICKET_TTL_SECONDS)
+    })
+    return ticket
+
+async def get_stream_user(
+    ticket: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    if credentials is not None:
+        return await resolve_user(credentials.credentials)
+    if ticket:
+        # TTL deletion lags, so expiry is also checked here
+        redeemed = await db.stream_tickets.find_one_and_delete(
+            {"ticket_hash": stream_ticket_hash(ticket), "expires_at": {"$gt": datetime.utcnow()}}
+        )
+        if redeemed is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+        return await load_user(redeemed["user_id"])
+    raise HTTPException(status_code=401, detail="Not authenticated")
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+# Bulk discount pricing
+# A product's bulk_discount_tiers ([{"min_qty": 10, "discount": 0.05}, ...]) are
+# compiled once into sorted thresholds with the best discount reachable at each,
+# so pricing a line is a binary search on quantity. Compiled schedules are cached
+# per product version (id, updated_at).
+class TierSchedule:
+    def __init__(self, tiers: List[dict]):
+        valid = []
+        for tier in tiers or []:
+            # Tiers stored before validation may be malformed; they are skipped, not fatal
+            try:
+                valid.append((int(tier["min_qty"]), min(max(float(tier["discount"]), 0.0), 1.0)))
+            except (KeyError, TypeError, ValueError):
+                continue
+        valid.sort()
+        self.min_quantities = [min_qty for min_qty, _ in valid]
+        # Running maximum so a larger order never gets a smaller discount
+        self.discounts = list(itertools.accumulate((discount for _, discount in valid), max))
+
+    def discount_for(self, quantity: int) -> float:
+        i = bisect_right(self.min_quantities, quantity)
+        return self.discounts[i - 1] if i else 0.0
+
+    def best_tier(self) -> Optional[tuple]:
+        # (min_qty, discount) of the first threshold reaching the largest discount
+        if not self.discounts:
+            return None
+        i = self.discounts.index(self.discounts[-1])
+        return self.min_quantities[i], self.discounts[i]
+
+class PricingEngine:
+    def __init__(self, cache_size: int, cache_ttl: float):
+        self.schedules = TTLCache(cache_size, cache_ttl)
+
+    def schedule(self, product: dict) -> TierSchedule:
+        key = (product["id"], product.get("updated_at"))
+        schedule = self.schedules.get(key)
+        if schedule is None:
+            schedule = TierSchedule(product.get("bulk_discount_tiers"))
+            self.schedules.set(key, schedule)
+        return schedule
+
+    def price_line(self, product: dict, quantity: int, unit_price: Optional[float] = None) -> dict:
+        unit_price = product["price_per_unit"] if unit_price is None else unit_price
+        discount_rate = self.schedule(product).discount_for(quantity)
+        subtotal = round(quantity * unit_price, 2)
+        discount_amount = round(subtotal * discount_rate, 2)
+        return {
+            "unit_price": unit_price,
+            "discount_rate": discount_rate,
+            "subtotal": subtotal,
+            "discount_amount": discount_amount,
+            "total": round(subtotal - discount_amount, 2)
+        }
+
+pricing_engine = PricingEngine(PRICING_CACHE_SIZE, PRICING_CACHE_TTL_SECONDS)
+
+PRICING_PROJECTION = {"_id": 0, "id": 1, "price_per_unit": 1, "bulk_discount_tiers": 1, "updated_at": 1}
+
+# Pagination
+# List endpoints page on _id: it is unique, always indexed, and follows insertion
+# order. The continuation token is the last returned _id, opaque to clients, and
+# is returned in the X-Next-Cursor header so response bodies keep their shape.
+class PageParams(BaseModel):
+    limit: int
+    after: Optional[str] = None
+    include_total: bool = False
+
+def page_params(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    include_total: bool = Query(False, description="Return the total match count in X-Total-Count")
+) -> PageParams:
+    return PageParams(limit=limit, after=after, include_total=include_total)
+
+def encode_cursor(object_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(object_id.binary).decode().rstrip("=")
+
+def decode_cursor(token: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_page(collection, query: dict, page: PageParams, response: Response,
+                     direction: int = ASCENDING, projection: Optional[dict] = None) -> List[dict]:
+    page_query = dict(query)
+    if page.after:
+        page_query["_id"] = {"$gt" if direction == ASCENDING else "$lt": decode_cursor(page.after)}
+    
+    # Fetch one extra document to learn whether another page exists
+    cursor = collection.find(page_query, projection).sort("_id", direction).limit(page.limit + 1)
+    if page.include_total:
+        # Counting is only paid for when asked, and runs alongside the page query
+        docs, total = await asyncio.gather(cursor.to_list(None), collection.count_documents(query))
+        response.headers["X-Total-Count"] = str(total)
+    else:
+        docs = await cursor.to_list(None)
+    
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1]["_id"])
+    return docs
+
+# Fast responses
+# List routes project documents to exactly their response model's fields, fill in
+# the model defaults that older documents lack, and serialize the result straight
+# to bytes with orjson. Returning a Response skips FastAPI's response_model
+# validation, which the routes keep for the OpenAPI schema only; documents were
+# validated by the models when they were written. A fields= query parameter narrows
+# the shape (and so the projection) to a sparse fieldset; id is always returned.
+class ResponseShape:
+    def __init__(self, model, names: Optional[List[str]] = None):
+        self.model = model
+        fields = {name: field for name, field in model.__fields__.items() if names is None or name in names}
+        self.fields = list(fields)
+        # Normalized field list for cache keys, None for the full model
+        self.selection = ",".join(sorted(fields)) if names is not None else None
+        self.projection = {name: 1 for name in fields}
+        self.defaults = {
+            name: field.default for name, field in fields.items()
+            if not field.is_required() and field.default_factory is None
+        }
+        # Lists of nested models (order items) are shaped recursively
+        self.nested = {
+            name: ResponseShape(args[0]) for name, field in fields.items()
+            for args in [get_args(field.annotation)]
+            if args and isinstance(args[0], type) and issubclass(args[0], BaseModel)
+        }
+
+    def document(self, doc: dict) -> dict:
+        doc = {**self.defaults, **doc}
+        doc.pop("_id", None)
+        for name, shape in self.nested.items():
+            doc[name] = [shape.document({key: item[key] for key in shape.fields if key in item}) for item in doc[name] or []]
+        return doc
+
+    def documents(self, docs: List[dict]) -> List[dict]:
+        return [self.document(doc) for doc in docs]
+
+    def select(self, fields: Optional[str]) -> "ResponseShape":
+        if not fields:
+            return self
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = names - set(self.fields)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(self.fields)}"
+            )
+        return ResponseShape(self.model, ["id", *names])
+
+FIELDS_DESCRIPTION = "Comma-separated fields to return (sparse fieldset); id is always included"
+
+PAGING_HEADERS = ("X-Next-Cursor", "X-Total-Count")
+
+def paging_headers(response: Response) -> dict:
+    return {name: response.headers[name] for name in PAGING_HEADERS if name in response.headers}
+
+# Models that aren't plain JSON types fall back to FastAPI's encoder
+def render_json(content) -> bytes:
+    return orjson.dumps(content, default=jsonable_encoder)
+
+def fast_response(content, response: Optional[Response] = None) -> Response:
+    headers = paging_headers(response) if response is not None else None
+    return Response(content=render_json(content), media_type="application/json", headers=headers)
+
+# Catalog versions
+# Catalog reads depend on tags: "suppliers" for the supplier list,
+# "products:<supplier_id>" and "reviews:<supplier_id>" for a supplier's products
+# and reviews, and "*" for everything. Every write bumps the version of the tags it
+# affects in catalog_versions, shared by all worker processes. A list response is
+# stamped with the versions it was built from: the stamp is its ETag, so a
+# matching If-None-Match is answered with a 304 after one small read of
+# catalog_versions, and it is part of the response cache key, so bumping a version
+# invalidates cached pages. A read that raced a write can only cache its result
+# under a stamp nobody will ask for again.
+async def bump_catalog_versions(*tags: str):
+    now = datetime.utcnow()
+    await db.catalog_versions.bulk_write([
+        UpdateOne({"_id": tag}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+        for tag in tags
+    ], ordered=False)
+
+async def catalog_versions(tags: List[str]) -> dict:
+    return {doc["_id"]: doc async for doc in catalog_collection("catalog_versions").find({"_id": {"$in": tags}})}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored on both sides
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+# Catalog response cache
+# The public catalog lists are cached as serialized response bytes (body plus paging
+# headers), keyed by route, normalized query parameters and catalog version stamp.
+# Stock levels change through carts and checkout without bumping versions, so for
+# lists showing stock the stamp also rolls over every CATALOG_CACHE_TTL_SECONDS:
+# cached or revalidated quantities are at most that old, and stock is always
+# checked when reserving. Cache store errors are logged and treated as misses.
+class MemoryCacheBackend:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.entries = TTLCache(max_bytes, ttl, weigh=len)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: bytes):
+        self.entries.set(key, value)
+
+    def metrics(self) -> dict:
+        return self.entries.metrics()
+
+# Shared by every worker process; needs the redis package (redis.asyncio)
+class RedisCacheBackend:
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio
+        self.redis = redis.asyncio.from_url(url)
+        self.ttl_ms = int(ttl * 1000)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(key)
+
+    async def set(self, key: str, value: bytes):
+        await self.redis.set(key, value, px=self.ttl_ms)
+
+    def metrics(self) -> dict:
+        return {"url": CATALOG_CACHE_REDIS_URL}
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.routes = {}
+        self.errors = 0
+
+    def route_stats(self, route: str) -> dict:
+        return self.routes.setdefault(route, {"hits": 0, "misses": 0, "not_modified": 0})
+
+    # Returns the entry to pass to store() and, when the request can be answered
+    # without running the query, the response: a 304 or the cached page
+    async def lookup(self, request: Request, route: str, params: dict, tags: List[str],
+                     volatile: bool = False) -> tuple:
+        tags = ["*", *tags]
+        versions = await catalog_versions(tags)
+        stamp = [versions[tag]["version"] if tag in versions else 0 for tag in tags]
+        if volatile:
+            stamp.append(int(time.time() // CATALOG_CACHE_TTL_SECONDS))
+        normalized = sorted((name, str(value)) for name, value in params.items() if value is not None)
+        digest = hashlib.sha1(json.dumps([route, normalized, tags, stamp]).encode()).hexdigest()
+        
+        headers = {"ETag": f'W/"{digest}"', "Cache-Control": "no-cache"}
+        modified = [versions[tag]["updated_at"] for tag in tags if tag in versions]
+        if modified:
+            headers["Last-Modified"] = format_datetime(max(modified).replace(tzinfo=timezone.utc), usegmt=True)
+        entry = {"route": route, "key": f"catalog:{digest}", "headers": headers}
+        
+        stats = self.route_stats(route)
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            stats["not_modified"] += 1
+            return entry, Response(status_code=304, headers=headers)
+        if self.backend is None:
+            return entry, None
+        try:
+            cached = await self.backend.get(entry["key"])
+        except Exception:
+            self.errors += 1
+            logger.warning(f"Catalog cache lookup failed for {route}", exc_info=True)
+            cached = None
+        if cached is None:
+            stats["misses"] += 1
+            return entry, None
+        stats["hits"] += 1
+        header_line, body = cached.split(b"\n", 1)
+        return entry, Response(content=body, media_type="application/json", headers={**headers, **json.loads(header_line)})
+
+    # Serializes content once, caches it and returns it as the response
+    async def store(self, entry: dict, content, response: Response) -> Response:
+        paging = paging_headers(response)
+        body = render_json(content)
+        if self.backend is not None:
+            try:
+                await self.backend.set(entry["key"], json.dumps(paging).encode() + b"\n" + body)
+            except Exception:
+                self.errors += 1
+                logger.warning(f"Catalog cache store failed for {entry['route']}", exc_info=True)
+        return Response(content=body, media_type="application/json", headers={**entry["headers"], **paging})
+
+    def metrics(self) -> dict:
+        return {
+            "backend": CATALOG_CACHE_BACKEND,
+            "errors": self.errors,
+            "routes": {
+                route: {**stats, "hit_rate": stats["hits"] / max(stats["hits"] + stats["misses"], 1)}
+                for route, stats in self.routes.items()
+            },
+            "store": self.backend.metrics() if self.backend is not None else None,
+        }
+
+def catalog_cache_backend():
+    if CATALOG_CACHE_BACKEND == "memory":
+        return MemoryCacheBackend(CATALOG_CACHE_MAX_BYTES, CATALOG_CACHE_TTL_SECONDS)
+    if CATALOG_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(CATALOG_CACHE_REDIS_URL, CATALOG_CACHE_TTL_SECONDS)
+    return None
+
+catalog_cache = ResponseCache(catalog_cache_backend())
+
+# Batched writes
+# Rebuilds stream their operations from a cursor and write them REBUILD_BATCH_SIZE
+# at a time, so memory stays bounded however large the collection is
+async def flush_in_batches(collection, operations) -> int:
+    modified = 0
+    batch = []
+    async for operation in operations:
+        batch.append(operation)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            modified += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        modified += (await collection.bulk_write(batch, ordered=False)).modified_count
+    return modified
+
+# Supplier locations
+# Market zone names are normalized into lowercase tokens stored in an indexed
+# location_tokens array. A search matches every query token exactly except the
+# last, which matches as a prefix so partially typed names still resolve. Anchored,
+# case-sensitive regexes like this one can use index bounds, unlike $options "i".
+def location_tokens(location: str) -> List[str]:
+    return list(dict.fromkeys(re.findall(r"[a-z0-9]+", location.lower())))
+
+def location_filter(location: str) -> dict:
+    tokens = location_tokens(location)
+    if not tokens:
+        return {}
+    return {"location_tokens": {"$all": tokens[:-1] + [re.compile("^" + re.escape(tokens[-1]))]}}
+
+# Adds the derived, indexed fields to a supplier document before it is stored
+def supplier_document(supplier: dict) -> dict:
+    supplier["location_tokens"] = location_tokens(supplier["location"])
+    if supplier.get("latitude") is not None and supplier.get("longitude") is not None:
+        supplier["geo"] = {"type": "Point", "coordinates": [supplier["longitude"], supplier["latitude"]]}
+    return supplier
+
+async def rebuild_supplier_locations() -> dict:
+    async def operations():
+        async for supplier in db.suppliers.find({}, {"id": 1, "location": 1, "latitude": 1, "longitude": 1}):
+            derived = supplier_document({k: v for k, v in supplier.items() if k != "_id"})
+            yield UpdateOne(
+                {"_id": supplier["_id"]},
+                {"$set": {k: derived[k] for k in ("location_tokens", "geo") if k in derived}}
+            )
+    
+    updated = await flush_in_batches(db.suppliers, operations())
+    if updated:
+        await bump_catalog_versions("suppliers")
+    return {"suppliers_updated": updated}
+
+# One-time migration run at startup: suppliers stored before location indexing lack
+# location_tokens (and geo), so ?location= and /suppliers/nearby would skip them
+async def backfill_supplier_locations() -> Optional[dict]:
+    if await db.suppliers.find_one({"location_tokens": {"$exists": False}}, {"_id": 1}) is None:
+        return None
+    report = await rebuild_supplier_locations()
+    logger.info(f"Backfilled supplier locations: {report}")
+    return report
+
+SUPPLIER_SHAPE = ResponseShape(Supplier)
+NEARBY_SUPPLIER_SHAPE = ResponseShape(NearbySupplier)
+PRODUCT_SHAPE = ResponseShape(Product)
+REVIEW_SHAPE = ResponseShape(Review)
+ORDER_SHAPE = ResponseShape(Order)
+NOTIFICATION_SHAPE = ResponseShape(Notification)
+
+# Database indexes
+# Every query issued by the routes below must be served by one of these indexes.
+INDEX_SPECS = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "suppliers": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("rating", DESCENDING)]),
+        IndexModel([("categories", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("location_tokens", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("geo", "2dsphere")]),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("supplier_id", ASCENDING), ("category", ASCENDING), ("price_per_unit", ASCENDING)]),
+        IndexModel([("supplier_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("supplier_id", ASCENDING), ("name", ASCENDING)]),
+        IndexModel([("category", ASCENDING)]),
+        IndexModel(
+            [("name", "text"), ("category", "text"), ("description", "text")],
+            weights={"name": 10, "category": 5, "description": 1},
+            name="product_search"
+        ),
+    ],
+    "reviews": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("supplier_id", ASCENDING), ("vendor_id", ASCENDING)], unique=True),
+        IndexModel([("supplier_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("vendor_id", ASCENDING)]),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("_id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("is_read", ASCENDING), ("created_at", ASCENDING)]),
+        # Only read notifications carry read_at, so unread ones never expire
+        IndexModel([("read_at", ASCENDING)], expireAfterSeconds=int(NOTIFICATION_READ_TTL_DAYS * 86400)),
+    ],
+    "notification_counters": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "stream_tickets": [
+        IndexModel([("ticket_hash", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "carts": [
+        IndexModel([("vendor_id", ASCENDING)], unique=True),
+        IndexModel([("items.product_id", ASCENDING)]),
+        IndexModel([("items.supplier_id", ASCENDING)]),
+    ],
+    "supplier_rollups": [
+        IndexModel([("supplier_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], unique=True),
+    ],
+    "reservations": [
+        # At most one active hold per vendor and product
+        IndexModel(
+            [("vendor_id", ASCENDING), ("product_id", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"status": "held"}
+        ),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)]),
+        IndexModel([("sweep_id", ASCENDING)], sparse=True),
+        # Settled holds are purged by MongoDB once purge_at passes
+        IndexModel([("purge_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("vendor_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("supplier_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("items.product_id", ASCENDING)]),
+    ],
+}
+
+# Representative query shape for each route, used to detect regressions to COLLSCAN
+QUERY_PLANS = [
+    {"route": "POST /auth/login", "collection": "users", "filter": {"email": "user@example.com"}},
+    {"route": "get_current_user", "collection": "users", "filter": {"id": "user-id"}},
+    {"route": "GET /suppliers", "collection": "suppliers", "filter": {"rating": {"$gte": 4.0}},
+     "sort": [("_id", ASCENDING)]},
+    {"route": "GET /suppliers?category", "collection": "suppliers", "filter": {"categories": "Vegetables"},
+     "sort": [("_id", ASCENDING)]},
+    {"route": "GET /suppliers?location", "collection": "suppliers",
+     "filter": location_filter("Central Mar"), "sort": [("_id", ASCENDING)]},
+    {"route": "GET /suppliers/my-stall", "collection": "suppliers", "filter": {"user_id": "user-id"}},
+    {"route": "GET /suppliers/{supplier_id}/products", "collection": "products",
+     "filter": {"supplier_id": "supplier-id", "category": "Vegetables", "price_per_unit": {"$gte": 1.0, "$lte": 10.0}},
+     "sort": [("_id", ASCENDING)]},
+    {"route": "GET /products/my-products", "collection": "products", "filter": {"supplier_id": "supplier-id"},
+     "sort": [("_id", ASCENDING)]},
+    {"route": "GET /products/search", "collection": "products", "filter": {"$text": {"$search": "tomato"}}},
+    {"route": "POST /products/import", "collection": "products", "filter": {"supplier_id": "supplier-id", "name": "Tomatoes"}},
+    {"route": "PUT /products/{product_id}", "collection": "products", "filter": {"id": "product-id", "supplier_id": "supplier-id"}},
+    {"route": "GET /suppliers/{supplier_id}/reviews", "collection": "reviews", "filter": {"supplier_id": "supplier-id"},
+     "sort": [("_id", ASCENDING)]},
+    {"route": "POST /reviews", "collection": "reviews", "filter": {"vendor_id": "user-id", "supplier_id": "supplier-id"}},
+    {"route": "GET /notifications", "collection": "notifications", "filter": {"user_id": "user-id"},
+     "sort": [("_id", DESCENDING)]},
+    {"route": "POST /notifications/bulk", "collection": "notifications",
+     "filter": {"user_id": "user-id", "is_read": False, "created_at": {"$lt": datetime(2025, 1, 1)}}},
+    {"route": "PUT /notifications/{notification_id}/read", "collection": "notifications",
+     "filter": {"id": "notification-id", "user_id": "user-id"}},
+    {"route": "GET /cart", "collection": "carts", "filter": {"vendor_id": "user-id"}},
+    {"route": "GET /orders/my-orders (vendor)", "collection": "orders", "filter": {"vendor_id": "user-id"},
+     "sort": [("_id", ASCENDING)]},
+    {"route": "GET /orders/my-orders (supplier)", "collection": "orders", "filter": {"supplier_id": "supplier-id"},
+     "sort": [("_id", ASCENDING)]},
+]
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-flight
+background_tasks = set()
+
+def start_background_task(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+index_status = {"state": "pending", "started_at": None, "finished_at": None, "collections": {}}
+
+async def ensure_indexes() -> dict:
+    index_status.update(state="building", started_at=datetime.utcnow(), finished_at=None, collections={})
+    failed = False
+    for collection, models in INDEX_SPECS.items():
+        results = index_status["collections"][collection] = {}
+        # One call per index so a failure (e.g. duplicates under a unique key) is reported precisely
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection].create_indexes([model])
+                results[name] = "ok"
+            except PyMongoError as e:
+                failed = True
+                results[name] = f"error: {e}"
+                logger.error(f"Failed to build index {collection}.{name}: {e}")
+    index_status.update(state="failed" if failed else "ready", finished_at=datetime.utcnow())
+    return index_status
+
+def plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+async def explain_query_plans() -> List[dict]:
+    report = []
+    for spec in QUERY_PLANS:
+        cursor = db[spec["collection"]].find(spec["filter"])
+        if spec.get("sort"):
+            cursor = cursor.sort(spec["sort"])
+        explain = await cursor.explain()
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({
+            "route": spec["route"],
+            "collection": spec["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        })
+    return report
+
+# Denormalized supplier categories
+# Each supplier document carries the distinct categories of its products so that
+# category filtering on /suppliers is a single indexed query on suppliers.
+async def add_supplier_category(supplier_id: str, category: str):
+    result = await db.suppliers.update_one({"id": supplier_id}, {"$addToSet": {"categories": category}})
+    if result.modified_count:
+        await bump_catalog_versions("suppliers")
+
+async def prune_supplier_category(supplier_id: str, category: str):
+    remaining = await db.products.find_one({"supplier_id": supplier_id, "category": category}, {"_id": 1})
+    if remaining is None:
+        result = await db.suppliers.update_one({"id": supplier_id}, {"$pull": {"categories": category}})
+        if result.modified_count:
+            await bump_catalog_versions("suppliers")
+
+# Recomputes one supplier's categories, for writes that touch many of its products at once
+async def refresh_supplier_categories(supplier_id: str):
+    categories = await db.products.distinct("category", {"supplier_id": supplier_id})
+    result = await db.suppliers.update_one({"id": supplier_id}, {"$set": {"categories": sorted(categories)}})
+    if result.modified_count:
+        await bump_catalog_versions("suppliers")
+
+# Recomputes every supplier's categories from the products collection, e.g. after bulk
+# edits made outside the API. Suppliers without products end up with an empty list.
+async def rebuild_supplier_categories() -> dict:
+    synced_at = datetime.utcnow()
+    cursor = db.products.aggregate([
+        {"$group": {"_id": "$supplier_id", "categories": {"$addToSet": "$category"}}}
+    ], allowDiskUse=True)
+    updated = await flush_in_batches(db.suppliers, (
+        UpdateOne(
+            {"id": group["_id"]},
+            {"$set": {"categories": sorted(group["categories"]), "categories_synced_at": synced_at}}
+        )
+        async for group in cursor
+    ))
+    
+    cleared = await db.suppliers.update_many(
+        {"categories_synced_at": {"$ne": synced_at}},
+        {"$set": {"categories": [], "categories_synced_at": synced_at}}
+    )
+    await bump_catalog_versions("suppliers")
+    return {"suppliers_updated": updated, "suppliers_without_products": cleared.modified_count}
+
+# One-time migration run at startup: suppliers stored before categories were
+# denormalized lack the field, and would never match a ?category= filter
+async def backfill_supplier_categories() -> Optional[dict]:
+    if await db.suppliers.find_one({"categories": {"$exists": False}}, {"_id": 1}) is None:
+        return None
+    report = await rebuild_supplier_categories()
+    logger.info(f"Backfilled supplier categories: {report}")
+    return report
+
+# Supplier ratings
+# Suppliers keep a running rating_sum, total_reviews and per-star histogram. A new
+# review folds into them with one pipeline update, which also derives the rounded
+# average in the same atomic write. Suppliers that predate these fields are seeded
+# from their stored average.
+async def add_supplier_rating(supplier_id: str, rating: int):
+    star = f"rating_histogram.{rating}"
+    await db.suppliers.update_one({"id": supplier_id}, [
+        {"$set": {
+            "rating_sum": {"$add": [
+                {"$ifNull": ["$rating_sum", {"$multiply": ["$rating", {"$ifNull": ["$total_reviews", 0]}]}]},
+                rating
+            ]},
+            "total_reviews": {"$add": [{"$ifNull": ["$total_reviews", 0]}, 1]},
+            star: {"$add": [{"$ifNull": [f"${star}", 0]}, 1]}
+        }},
+        {"$set": {"rating": {"$round": [{"$divide": ["$rating_sum", "$total_reviews"]}, 1]}}}
+    ])
+
+async def rebuild_supplier_ratings() -> dict:
+    cursor = db.reviews.aggregate([
+        {"$group": {
+            "_id": "$supplier_id",
+            "rating_sum": {"$sum": "$rating"},
+            "total_reviews": {"$sum": 1},
+            **{f"stars_{n}": {"$sum": {"$cond": [{"$eq": ["$rating", n]}, 1, 0]}} for n in range(1, 6)}
+        }}
+    ], allowDiskUse=True)
+    updated = await flush_in_batches(db.suppliers, (
+        UpdateOne({"id": group["_id"]}, {"$set": {
+            "rating_sum": group["rating_sum"],
+            "total_reviews": group["total_reviews"],
+            "rating": round(group["rating_sum"] / group["total_reviews"], 1),
+            "rating_histogram": {str(n): group[f"stars_{n}"] for n in range(1, 6)}
+        }})
+        async for group in cursor
+    ))
+    if updated:
+        await bump_catalog_versions("suppliers")
+    return {"suppliers_updated": updated}
+
+async def reconcile_supplier_ratings_periodically():
+    while True:
+        await asyncio.sleep(RATING_RECONCILE_INTERVAL_SECONDS)
+        try:
+            result = await rebuild_supplier_ratings()
+            logger.info(f"Supplier rating reconciliation: {result}")
+        except PyMongoError as e:
+            logger.error(f"Supplier rating reconciliation failed: {e}")
+
+# Analytics rollups
+# Every order is folded into per-supplier hourly, daily and all-time documents in
+# supplier_rollups (revenue, order count, units, and units/revenue per product),
+# so the dashboard reads a few small documents instead of scanning orders.
+ROLLUP_GRANULARITIES = ("hour", "day", "all")
+
+def rollup_bucket(moment: datetime, granularity: str) -> Optional[datetime]:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return None
+
+def rollup_operations(order: dict) -> List[UpdateOne]:
+    inc = {
+        "revenue": order["total_amount"],
+        "orders_count": 1,
+        "units": sum(item["quantity"] for item in order["items"])
+    }
+    names = {}
+    for item in order["items"]:
+        key = f"products.{item['product_id']}"
+        inc[f"{key}.units"] = inc.get(f"{key}.units", 0) + item["quantity"]
+        revenue = item["quantity"] * item["price_per_unit"] * (1 - item.get("discount_rate", 0.0))
+        inc[f"{key}.revenue"] = inc.get(f"{key}.revenue", 0) + revenue
+        if item.get("name"):
+            names[f"{key}.name"] = item["name"]
+    
+    return [
+        UpdateOne(
+            {
+                "supplier_id": order["supplier_id"],
+                "granularity": granularity,
+                "bucket": rollup_bucket(order["created_at"], granularity)
+            },
+            {"$inc": inc, "$set": names} if names else {"$inc": inc},
+            upsert=True
+        )
+        for granularity in ROLLUP_GRANULARITIES
+    ]
+
+# Order event hook: called once for every order that is created
+async def record_order_rollups(orders: List[dict]):
+    operations = [op for order in orders for op in rollup_operations(order)]
+    if operations:
+        await db.supplier_rollups.bulk_write(operations, ordered=False)
+
+def average_order_value(rollup: dict) -> float:
+    return rollup["revenue"] / rollup["orders_count"] if rollup.get("orders_count") else 0.0
+
+def rollup_point(rollup: dict) -> dict:
+    return {
+        "bucket": rollup["bucket"],
+        "revenue": rollup["revenue"],
+        "orders": rollup["orders_count"],
+        "units": rollup["units"],
+        "average_order_value": average_order_value(rollup)
+    }
+
+# Backfill: drops the rollups (for one supplier or all) and replays every
+# non-cancelled order through the same operations used for live order events.
+# Orders placed while it runs may be counted twice, so run it when traffic is quiet.
+async def rebuild_analytics_rollups(supplier_id: Optional[str] = None) -> dict:
+    scope = {"supplier_id": supplier_id} if supplier_id else {}
+    await db.supplier_rollups.delete_many(scope)
+    
+    replayed = 0
+    cursor = db.orders.find(
+        {**scope, "status": {"$ne": "cancelled"}},
+        {"_id": 0, "supplier_id": 1, "items": 1, "total_amount": 1, "created_at": 1}
+    )
+    
+    async def operations():
+        nonlocal replayed
+        async for order in cursor:
+            replayed += 1
+            for operation in rollup_operations(order):
+                yield operation
+    
+    await flush_in_batches(db.supplier_rollups, operations())
+    return {"orders_replayed": replayed}
+
+# Stock reservations
+# Adding to the cart holds stock with a conditional atomic decrement on the product,
+# recorded as a hold in the reservations collection. Holds expire after
+# RESERVATION_HOLD_MINUTES; the sweeper returns expired holds' stock in batches and
+# checkout converts live holds into orders. A hot SKU only contends on its own
+# product document, with one small hold document per vendor. The product's
+# quantity_reserved counts the units its live holds took out of quantity_available;
+# both move in the same atomic update, so a supplier setting an absolute stock
+# count can take the held units off it (see product_update).
+reservation_stats = {"holds_placed": 0, "holds_rejected": 0, "holds_expired": 0, "units_returned_by_sweeper": 0}
+
+async def reserve_stock(vendor_id: str, product_id: str, quantity: int) -> dict:
+    now = datetime.utcnow()
+    product = await db.products.find_one_and_update(
+        {"id": product_id, "quantity_available": {"$gte": quantity}},
+        {"$inc": {"quantity_available": -quantity, "quantity_reserved": quantity}},
+        projection={"_id": 0, "id": 1, "name": 1, "supplier_id": 1, "price_per_unit": 1}
+    )
+    if product is None:
+        reservation_stats["holds_rejected"] += 1
+        if not await db.products.find_one({"id": product_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(status_code=409, detail="Insufficient stock")
+    
+    hold = {
+        "$inc": {"quantity": quantity},
+        "$set": {"expires_at": now + timedelta(minutes=RESERVATION_HOLD_MINUTES), "updated_at": now},
+        "$setOnInsert": {"id": str(uuid.uuid4()), "supplier_id": product["supplier_id"], "created_at": now}
+    }
+    query = {"vendor_id": vendor_id, "product_id": product_id, "status": "held"}
+    try:
+        try:
+            await db.reservations.update_one(query, hold, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent add created the hold first; extend it instead
+            await db.reservations.update_one(query, hold, upsert=True)
+    except Exception:
+        await db.products.update_one({"id": product_id}, {"$inc": stock_returned(quantity)})
+        raise
+    
+    reservation_stats["holds_placed"] += 1
+    return product
+
+def stock_returned(quantity: int) -> dict:
+    return {"quantity_available": quantity, "quantity_reserved": -quantity}
+
+# Product writes setting stock as an absolute on-hand count leave the units held in
+# carts deducted; quantity_available goes negative if more is held than the new
+# count, and recovers as those holds are released
+def product_update(fields: dict, on_insert: Optional[dict] = None) -> List[dict]:
+    stage = {name: {"$literal": value} for name, value in fields.items()}
+    for name, value in (on_insert or {}).items():
+        stage[name] = {"$ifNull": [f"${name}", {"$literal": value}]}
+    if fields.get("quantity_available") is not None:
+        stage["quantity_available"] = {
+            "$subtract": [fields["quantity_available"], {"$ifNull": ["$quantity_reserved", 0]}]
+        }
+    return [{"$set": stage}]
+
+# Returns quantity units of a vendor's hold to stock, or the whole hold when
+# quantity is None or covers all of it
+async def release_stock(vendor_id: str, product_id: str, quantity: Optional[int] = None):
+    now = datetime.utcnow()
+    query = {"vendor_id": vendor_id, "product_id": product_id, "status": "held"}
+    if quantity is not None:
+        hold = await db.reservations.find_one_and_update(
+            {**query, "quantity": {"$gt": quantity}},
+            {"$inc": {"quantity": -quantity}, "$set": {"updated_at": now}}
+        )
+        if hold is not None:
+            await db.products.update_one({"id": product_id}, {"$inc": stock_returned(quantity)})
+            return
+    
+    hold = await db.reservations.find_one_and_update(
+        query,
+        {"$set": {
+            "status": "released",
+            "updated_at": now,
+            "purge_at": now + timedelta(hours=RESERVATION_RETENTION_HOURS)
+        }},
+        projection={"quantity": 1}
+    )
+    if hold is not None:
+        await db.products.update_one({"id": product_id}, {"$inc": stock_returned(hold["quantity"])})
+
+# Claims a batch of expired holds under a sweep id so that checkout (which only
+# converts "held" holds) and other sweepers can't touch them, returns their stock
+# with one $inc per product, then marks them released. A crash between the last
+# two steps leaves holds in "releasing" for manual reconciliation rather than
+# risking returning the same stock twice.
+async def sweep_expired_reservations() -> int:
+    released = 0
+    while True:
+        now = datetime.utcnow()
+        expired = await db.reservations.find(
+            {"status": "held", "expires_at": {"$lt": now}},
+            {"_id": 1}
+        ).limit(RESERVATION_SWEEP_BATCH_SIZE).to_list(None)
+        if not expired:
+            return released
+        
+        sweep_id = str(uuid.uuid4())
+        await db.reservations.update_many(
+            {"_id": {"$in": [h["_id"] for h in expired]}, "status": "held", "expires_at": {"$lt": now}},
+            {"$set": {"status": "releasing", "sweep_id": sweep_id, "updated_at": now}}
+        )
+        returns = await db.reservations.aggregate([
+            {"$match": {"sweep_id": sweep_id}},
+            {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}, "holds": {"$sum": 1}}}
+        ]).to_list(None)
+        if returns:
+            await db.products.bulk_write([
+                UpdateOne({"id": r["_id"]}, {"$inc": stock_returned(r["quantity"])})
+                for r in returns
+            ], ordered=False)
+        await db.reservations.update_many(
+            {"sweep_id": sweep_id},
+            {"$set": {"status": "released", "purge_at": now + timedelta(hours=RESERVATION_RETENTION_HOURS)}}
+        )
+        
+        holds = sum(r["holds"] for r in returns)
+        reservation_stats["holds_expired"] += holds
+        reservation_stats["units_returned_by_sweeper"] += sum(r["quantity"] for r in returns)
+        released += holds
+
+# Recomputes quantity_reserved from the live holds. Startup runs it once for holds
+# placed before products tracked their reserved units.
+async def rebuild_reserved_stock() -> dict:
+    cursor = db.reservations.aggregate([
+        {"$match": {"status": {"$in": ["held", "releasing"]}}},
+        {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}}}
+    ])
+    updated = await flush_in_batches(db.products, (
+        UpdateOne({"id": group["_id"]}, {"$set": {"quantity_reserved": group["quantity"]}})
+        async for group in cursor
+    ))
+    return {"products_updated": updated}
+
+async def backfill_reserved_stock() -> Optional[dict]:
+    held = await db.reservations.distinct("product_id", {"status": {"$in": ["held", "releasing"]}})
+    if not held or await db.products.find_one(
+        {"id": {"$in": held}, "quantity_reserved": {"$exists": False}}, {"_id": 1}
+    ) is None:
+        return None
+    report = await rebuild_reserved_stock()
+    logger.info(f"Backfilled reserved stock: {report}")
+    return report
+
+async def sweep_reservations_periodically():
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_INTERVAL_SECONDS)
+        try:
+            released = await sweep_expired_reservations()
+            if released:
+                logger.info(f"Released {released} expired stock holds")
+        except PyMongoError as e:
+            logger.error(f"Reservation sweep failed: {e}")
+
+# Notification delivery
+# New notifications are pushed to connected clients through an in-process hub: one
+# bounded queue per open stream, so an idle connection costs a queue and a parked
+# coroutine. The hub only reaches streams held by this worker process. Unread counts
+# live in notification_counters and are adjusted by every write, never queried.
+class NotificationHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, user_id: str, event: dict):
+        self.stats["published"] += 1
+        for queue in self.subscribers.get(user_id, ()):
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than grow without bound
+                queue.get_nowait()
+                self.stats["dropped"] += 1
+            queue.put_nowait(event)
+            self.stats["delivered"] += 1
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "users": len(self.subscribers),
+            "connections": sum(len(queues) for queues in self.subscribers.values())
+        }
+
+notification_hub = NotificationHub(NOTIFICATION_STREAM_QUEUE_SIZE)
+
+async def create_notifications(notifications: List[Notification]):
+    if not notifications:
+        return
+    await db.notifications.insert_many([n.dict() for n in notifications], ordered=False)
+    
+    unread = Counter(n.user_id for n in notifications if not n.is_read)
+    if unread:
+        await db.notification_counters.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$inc": {"unread": count}}, upsert=True)
+            for user_id, count in unread.items()
+        ], ordered=False)
+    
+    for notification in notifications:
+        notification_hub.publish(notification.user_id, jsonable_encoder(notification))
+
+# A decrement never creates the counter: a missing counter is seeded from the
+# notifications themselves on the next unread-count request
+async def adjust_unread_count(user_id: str, delta: int):
+    if delta:
+        await db.notification_counters.update_one({"user_id": user_id}, {"$inc": {"unread": delta}}, upsert=delta > 0)
+
+async def rebuild_notification_counters() -> dict:
+    counts = await db.notifications.aggregate([
+        {"$match": {"is_read": False}},
+        {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    synced_at = datetime.utcnow()
+    for i in range(0, len(counts), REBUILD_BATCH_SIZE):
+        await db.notification_counters.bulk_write([
+            UpdateOne({"user_id": c["_id"]}, {"$set": {"unread": c["unread"], "synced_at": synced_at}}, upsert=True)
+            for c in counts[i:i + REBUILD_BATCH_SIZE]
+        ], ordered=False)
+    # Users whose notifications are all read
+    zeroed = await db.notification_counters.update_many(
+        {"synced_at": {"$ne": synced_at}},
+        {"$set": {"unread": 0, "synced_at": synced_at}}
+    )
+    return {"users_with_unread": len(counts), "users_zeroed": zeroed.modified_count}
+
+# Notification fan-out
+# Product writes enqueue an event and return immediately; a background worker finds
+# the interested vendors with indexed queries (past buyers, vendors holding the
+# product or supplier in their cart, reviewers of the supplier) and writes their
+# notifications with insert_many in batches of NOTIFICATION_BATCH_SIZE.
+fanout_queue = asyncio.Queue(maxsize=NOTIFICATION_FANOUT_QUEUE_SIZE)
+fanout_stats = {"events": 0, "dropped_events": 0, "failed_events": 0, "notifications": 0}
+
+def enqueue_fanout(event: dict):
+    try:
+        fanout_queue.put_nowait(event)
+    except asyncio.QueueFull:
+        fanout_stats["dropped_events"] += 1
+        logger.warning(f"Notification fan-out queue full, dropping {event['type']} event")
+
+async def distinct_vendors(collection, query: dict, field: str = "vendor_id") -> set:
+    # $group streams results in batches, unlike distinct() whose reply is capped at 16MB
+    cursor = collection.aggregate([{"$match": query}, {"$group": {"_id": f"${field}"}}], allowDiskUse=True)
+    return {group["_id"] async for group in cursor}
+
+async def interested_vendors(event: dict) -> set:
+    product = event["product"]
+    supplier_id = product["supplier_id"]
+    if event["type"] == "new_product":
+        buyers = db.orders, {"supplier_id": supplier_id}
+        cart_holders = db.carts, {"items.supplier_id": supplier_id}
+    else:
+        buyers = db.orders, {"items.product_id": product["id"]}
+        cart_holders = db.carts, {"items.product_id": product["id"]}
+    groups = await asyncio.gather(
+        distinct_vendors(*buyers),
+        distinct_vendors(*cart_holders),
+        distinct_vendors(db.reviews, {"supplier_id": supplier_id})
+    )
+    return set().union(*groups)
+
+def fanout_message(event: dict, stall_name: str) -> tuple:
+    product = event["product"]
+    if event["type"] == "price_drop":
+        return (
+            f"Price drop: {product['name']}",
+            f"{stall_name} lowered {product['name']} from {event['old_price']:.2f} "
+            f"to {product['price_per_unit']:.2f} per {product['unit']}"
+        )
+    if event["type"] == "bulk_discount":
+        min_qty, discount = TierSchedule(product["bulk_discount_tiers"]).best_tier()
+        return (
+            f"Bulk discount on {product['name']}",
+            f"{stall_name} now offers {discount:.0%} off {product['name']} for {min_qty}+ {product['unit']}"
+        )
+    return (
+        f"New from {stall_name}",
+        f"{product['name']} is now available at {product['price_per_unit']:.2f} per {product['unit']}"
+    )
+
+async def fan_out(event: dict):
+    product = event["product"]
+    vendors, supplier = await asyncio.gather(
+        interested_vendors(event),
+        db.suppliers.find_one({"id": product["supplier_id"]}, {"stall_name": 1})
+    )
+    if not vendors:
+        return
+    
+    title, message = fanout_message(event, supplier["stall_name"] if supplier else "A supplier")
+    vendors = sorted(vendors)
+    for i in range(0, len(vendors), NOTIFICATION_BATCH_SIZE):
+        await create_notifications([
+            Notification(user_id=vendor_id, type=event["type"], title=title, message=message)
+            for vendor_id in vendors[i:i + NOTIFICATION_BATCH_SIZE]
+        ])
+    fanout_stats["notifications"] += len(vendors)
+
+async def run_notification_fanout():
+    while True:
+        event = await fanout_queue.get()
+        try:
+            await fan_out(event)
+            fanout_stats["events"] += 1
+        except Exception:
+            fanout_stats["failed_events"] += 1
+            logger.exception(f"Notification fan-out failed for {event['type']} event")
+        finally:
+            fanout_queue.task_done()
+
+# Bulk product import
+# Uploads are read from the request stream line by line and written as upserts in
+# bulk_write batches, so memory stays bounded by the batch size whatever the file
+# size. A row with an id updates that product; otherwise it is matched on the
+# supplier's product name. Batches already written stay written if the upload is
+# cut off or rejected part way through.
+IMPORT_CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+async def stream_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(buffer) > MAX_IMPORT_LINE_LENGTH:
+            raise HTTPException(status_code=413, detail="Import line too long")
+    buffer += decoder.decode(b"", final=True)
+    if buffer.strip():
+        yield buffer.rstrip("\r")
+
+# Yields (row number, record or error message). One csv.reader parses the whole
+# upload, so quoted fields may span lines and stray quotes in unquoted fields are
+# literal. It reads from a look-ahead buffer refilled to MAX_IMPORT_LINE_LENGTH
+# before each record: any row that fits is fully buffered, and a row that runs past
+# the buffer (e.g. an unclosed quote) is rejected instead of swallowing the file.
+async def csv_records(lines):
+    buffered = deque()
+    size = 0
+    exhausted = False
+    
+    async def fill():
+        nonlocal size, exhausted
+        while not exhausted and size < MAX_IMPORT_LINE_LENGTH:
+            try:
+                line = await lines.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                break
+            buffered.append(line + "\n")
+            size += len(line) + 1
+    
+    def buffered_lines():
+        nonlocal size
+        while buffered or not exhausted:
+            if not buffered:
+                raise HTTPException(status_code=413, detail="Import row too long")
+            line = buffered.popleft()
+            size -= len(line)
+            yield line
+    
+    reader = csv.reader(buffered_lines(), strict=True)
+    header = None
+    row = 0
+    while True:
+        await fill()
+        try:
+            values = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            if exhausted and not buffered:
+                yield row + 1, "Unterminated quoted field"
+                break
+            row += 1
+            yield row, f"Invalid CSV: {e}"
+            continue
+        if not "".join(values).strip() and len(values) <= 1:
+            continue
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        record = dict(zip(header, values))
+        tiers = record.get("bulk_discount_tiers", "").strip()
+        try:
+            record["bulk_discount_tiers"] = json.loads(tiers) if tiers else []
+        except ValueError:
+            yield row, "bulk_discount_tiers: invalid JSON"
+            continue
+        yield row, record
+
+async def ndjson_records(lines):
+    row = 0
+    async for line in lines:
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row, "Invalid JSON"
+            continue
+        yield row, record if isinstance(record, dict) else "Expected a JSON object"
+
+def validation_message(exc: ValueError) -> str:
+    if not hasattr(exc, "errors"):
+        return str(exc)
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+def import_operation(supplier_id: str, record: dict, now: datetime) -> tuple:
+    product_id = record.get("id") or None
+    fields = ProductCreate(**record).dict()
+    fields["updated_at"] = now
+    on_insert = {"created_at": now}
+    if product_id:
+        key = {"supplier_id": supplier_id, "id": str(product_id)}
+    else:
+        key = {"supplier_id": supplier_id, "name": fields["name"]}
+        on_insert["id"] = str(uuid.uuid4())
+    return tuple(key.items()), UpdateOne(key, product_update(fields, on_insert), upsert=True)
+
+def record_import_error(report: dict, row: int, message: str):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_IMPORT_ERRORS:
+        report["errors"].append({"row": row, "error": message})
+    else:
+        report["errors_truncated"] = True
+
+# batch maps each product key to its (row, operation)
+async def write_import_batch(batch: dict, report: dict):
+    rows = list(batch.values())
+    try:
+        result = await db.products.bulk_write([operation for _, operation in rows], ordered=False)
+        report["created"] += result.upserted_count
+        report["updated"] += result.matched_count
+    except BulkWriteError as exc:
+        report["created"] += exc.details["nUpserted"]
+        report["updated"] += exc.details["nMatched"]
+        for error in exc.details["writeErrors"]:
+            row = rows[error["index"]][0]
+            if error["code"] == 11000:
+                record_import_error(report, row, "Product id is already used by another supplier")
+            else:
+                record_import_error(report, row, error["errmsg"])
+
+# Streaming exports
+# Exports stream from a cursor sorted on _id, fetched and flushed batch_size documents
+# at a time, so memory is bounded by one batch. An interrupted download resumes with
+# after=<id of the last record received>; a resumed CSV omits the header so the
+# parts can be concatenated. Nested values are JSON-encoded in CSV cells, the same
+# form the product import accepts.
+EXPORT_MODELS = {"products": Product, "orders": Order, "reviews": Review}
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+class ExportParams(BaseModel):
+    format: Literal["ndjson", "csv"]
+    after: Optional[str] = None
+    batch_size: int
+
+def export_params(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    after: Optional[str] = Query(None, description="id of the last record received, to resume a download"),
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=MAX_EXPORT_BATCH_SIZE)
+) -> ExportParams:
+    return ExportParams(format=export_format, after=after, batch_size=batch_size)
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+def csv_cell(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=export_value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+async def export_chunks(cursor, fields: List[str], params: ExportParams):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if params.format == "csv" and not params.after:
+        writer.writerow(fields)
+    written = 0
+    async for doc in cursor:
+        if params.format == "csv":
+            writer.writerow([csv_cell(doc.get(field)) for field in fields])
+        else:
+            buffer.write(json.dumps(doc, default=export_value))
+            buffer.write("\n")
+        written += 1
+        if written % params.batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+async def export_response(name: str, query: dict, params: ExportParams) -> StreamingResponse:
+    collection = db[name]
+    if params.after:
+        anchor = await collection.find_one({**query, "id": params.after}, {"_id": 1})
+        if anchor is None:
+            raise HTTPException(status_code=400, detail="Unknown resume position")
+        query = {**query, "_id": {"$gt": anchor["_id"]}}
+    
+    fields = list(EXPORT_MODELS[name].__fields__)
+    projection = {**{field: 1 for field in fields}, "_id": 0}
+    cursor = collection.find(query, projection).sort("_id", ASCENDING).batch_size(params.batch_size)
+    return StreamingResponse(
+        export_chunks(cursor, fields, params),
+        media_type=EXPORT_MEDIA_TYPES[params.format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{params.format}"'}
+    )
+
+# Synthetic data for load testing
+# Every document is generated from its own Random seeded with (seed, kind, index) and
+# has a uuid5 id derived the same way, so a run is reproducible, batches can be
+# generated and inserted in any order, and orders can reference products without
+# reading them back. Timestamps are spread over the `days` before the current UTC
+# midnight. Popularity is skewed: product i belongs to the supplier whose block
+# contains i, block sizes shrink with the supplier's rank, and orders and reviews
+# pick low indexes far more often (skew=1 is uniform). Re-running the same seed
+# only inserts what is missing.
+SEED_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "seed.micromarket")
+
+SEED_CATALOG = {
+    "Vegetables": (["Tomatoes", "Onions", "Potatoes", "Spinach", "Bell Peppers", "Carrots", "Cabbage", "Okra"], 1.0, 6.0),
+    "Fruits": (["Mangoes", "Bananas", "Pineapples", "Papayas", "Coconuts", "Guavas", "Lemons", "Dragon Fruit"], 1.5, 12.0),
+    "Spices": (["Cumin Powder", "Turmeric Powder", "Chili Powder", "Coriander Seeds", "Garam Masala", "Black Pepper"], 8.0, 30.0),
+    "Herbs": (["Basil", "Mint", "Coriander Leaves", "Curry Leaves", "Oregano", "Bay Leaves"], 3.0, 20.0),
+    "Grains": (["Basmati Rice", "Wheat Flour", "Chickpeas", "Red Lentils", "Millet", "Semolina"], 0.8, 5.0),
+    "Dairy": (["Paneer", "Butter", "Yogurt", "Ghee", "Cream", "Cheese"], 4.0, 18.0),
+}
+SEED_VARIETIES = ["Organic", "Fresh", "Premium", "Local", "Farm", "Select", "Wholesale", "Daily"]
+SEED_MARKETS = [
+    ("Central Market District", 19.0760, 72.8777),
+    ("East Market Zone", 19.0850, 72.9080),
+    ("Spice Alley", 19.0600, 72.8650),
+    ("North Wholesale Yard", 19.1200, 72.8800),
+    ("Riverside Bazaar", 19.0400, 72.8500),
+    ("Old Town Market", 19.0950, 72.8400),
+]
+SEED_UNITS = ["kg", "kg", "kg", "pieces", "dozen", "bunch"]
+SEED_TIERS = [(10, 0.05), (25, 0.10), (50, 0.15), (100, 0.20)]
+SEED_ORDER_STATUSES = (["delivered", "confirmed", "pending", "cancelled"], [60, 20, 15, 5])
+SEED_RATINGS = ([1, 2, 3, 4, 5], [3, 5, 12, 35, 45])
+SEED_COMMENTS = ["Great quality", "Fresh and on time", "Good value for bulk orders",
+                 "Delivery was late", "Consistent supplier", "Prices could be better"]
+
+class SeedConfig(BaseModel):
+    seed: int = 1
+    suppliers: int = Field(100, ge=1, le=1_000_000)
+    products: int = Field(10_000, ge=0, le=50_000_000)
+    vendors: int = Field(1_000, ge=1, le=10_000_000)
+    orders: int = Field(20_000, ge=0, le=100_000_000)
+    reviews: int = Field(5_000, ge=0, le=100_000_000)
+    days: int = Field(90, ge=1, le=3650)
+    skew: float = Field(2.0, ge=1.0, le=10.0)
+    batch_size: int = Field(1_000, ge=1, le=10_000)
+    concurrency: int = Field(4, ge=1, le=32)
+    password: str = "seedpass123"
+
+def seed_id(seed: int, kind: str, index: int) -> str:
+    return str(uuid.uuid5(SEED_NAMESPACE, f"{seed}:{kind}:{index}"))
+
+def skewed_index(rng: random.Random, count: int, skew: float) -> int:
+    return min(int(count * rng.random() ** skew), count - 1)
+
+class SeedPlan:
+    def __init__(self, config: SeedConfig, password_hash: str):
+        self.config = config
+        self.password_hash = password_hash
+        self.until = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        # First product index of each supplier's block
+        self.supplier_starts = [
+            round(config.products * (1 - (1 - s / config.suppliers) ** config.skew))
+            for s in range(config.suppliers)
+        ]
+        # Hot products are regenerated for many orders
+        self.product_cache = TTLCache(50_000, 3600)
+        self.pricing = PricingEngine(50_000, 3600)
+
+    def rng(self, kind: str, index: int) -> random.Random:
+        return random.Random(f"{self.config.seed}:{kind}:{index}")
+
+    def moment(self, rng: random.Random) -> datetime:
+        return self.until - timedelta(seconds=rng.randrange(self.config.days * 86400))
+
+    def supplier_of(self, product_index: int) -> int:
+        return bisect_right(self.supplier_starts, product_index) - 1
+
+    def supplier_products(self, supplier_index: int) -> range:
+        end = self.supplier_starts[supplier_index + 1] if supplier_index + 1 < self.config.suppliers else self.config.products
+        return range(self.supplier_starts[supplier_index], end)
+
+    def user(self, index: int) -> dict:
+        # The first `suppliers` users own the supplier profiles, the rest are vendors
+        seed = self.config.seed
+        if index < self.config.suppliers:
+            kind, name, email = "supplier-user", f"Seed Supplier {index}", f"supplier{index}.seed{seed}@example.com"
+        else:
+            index -= self.config.suppliers
+            kind, name, email = "vendor", f"Seed Vendor {index}", f"vendor{index}.seed{seed}@example.com"
+        return {
+            "id": seed_id(seed, kind, index),
+            "email": email,
+            "name": name,
+            "user_type": "supplier" if kind == "supplier-user" else "vendor",
+            "created_at": self.moment(self.rng(kind, index)),
+            "password": self.password_hash
+        }
+
+    def supplier(self, index: int) -> dict:
+        rng = self.rng("supplier", index)
+        market, latitude, longitude = rng.choice(SEED_MARKETS)
+        category = rng.choice(list(SEED_CATALOG))
+        return supplier_document({
+            "id": seed_id(self.config.seed, "supplier", index),
+            "user_id": seed_id(self.config.seed, "supplier-user", index),
+            "stall_name": f"{rng.choice(SEED_VARIETIES)} {category} Traders #{index}",
+            "description": f"Wholesale {category.lower()} supplier at {market}",
+            "image_url": f"https://picsum.photos/seed/supplier{index}/400/300",
+            "contact_phone": f"+1-555-{index % 10000:04d}",
+            "location": market,
+            "rating": 0.0,
+            "rating_sum": 0,
+            "delivery_rating": round(rng.uniform(3.5, 5.0), 1),
+            "total_reviews": 0,
+            "rating_histogram": {},
+            "categories": [],
+            "latitude": round(latitude + rng.uniform(-0.01, 0.01), 6),
+            "longitude": round(longitude + rng.uniform(-0.01, 0.01), 6),
+            "created_at": self.moment(rng)
+        })
+
+    def product(self, index: int) -> dict:
+        product = self.product_cache.get(index)
+        if product is not None:
+            return product
+        rng = self.rng("product", index)
+        category = rng.choice(list(SEED_CATALOG))
+        items, low, high = SEED_CATALOG[category]
+        name = f"{rng.choice(SEED_VARIETIES)} {rng.choice(items)}"
+        unit = rng.choice(SEED_UNITS)
+        created_at = self.moment(rng)
+        product = {
+            "id": seed_id(self.config.seed, "product", index),
+            "supplier_id": seed_id(self.config.seed, "supplier", self.supplier_of(index)),
+            "name": name,
+            "category": category,
+            "price_per_unit": round(rng.uniform(low, high), 2),
+            "unit": unit,
+            "quantity_available": rng.randrange(0, 1000),
+            "bulk_discount_tiers": [
+                {"min_qty": min_qty, "discount": discount} for min_qty, discount in SEED_TIERS[:rng.randrange(len(SEED_TIERS) + 1)]
+            ],
+            "image_url": f"https://picsum.photos/seed/product{index}/400/300",
+            "description": f"{name}, sold in bulk by the {unit}",
+            "created_at": created_at,
+            "updated_at": created_at
+        }
+        self.product_cache.set(index, product)
+        return product
+
+    def order(self, index: int) -> dict:
+        rng = self.rng("order", index)
+        first = skewed_index(rng, self.config.products, self.config.skew)
+        supplier_index = self.supplier_of(first)
+        block = self.supplier_products(supplier_index)
+        chosen = dict.fromkeys([first] + [rng.choice(block) for _ in range(rng.randrange(4))])
+        lines = []
+        for product_index in chosen:
+            product = self.product(product_index)
+            quantity = 1 + int(99 * rng.random() ** 3)
+            lines.append((product, quantity, self.pricing.price_line(product, quantity)))
+        return {
+            "id": seed_id(self.config.seed, "order", index),
+            "vendor_id": seed_id(self.config.seed, "vendor", skewed_index(rng, self.config.vendors, self.config.skew)),
+            "supplier_id": seed_id(self.config.seed, "supplier", supplier_index),
+            "items": [
+                {
+                    "product_id": product["id"],
+                    "supplier_id": product["supplier_id"],
+                    "quantity": quantity,
+                    "price_per_unit": price["unit_price"],
+                    "name": product["name"],
+                    "discount_rate": price["discount_rate"]
+                }
+                for product, quantity, price in lines
+            ],
+            "subtotal": round(sum(price["subtotal"] for _, _, price in lines), 2),
+            "discount_amount": round(sum(price["discount_amount"] for _, _, price in lines), 2),
+            "total_amount": round(sum(price["total"] for _, _, price in lines), 2),
+            "status": rng.choices(*SEED_ORDER_STATUSES)[0],
+            "created_at": self.moment(rng)
+        }
+
+    def review(self, index: int) -> dict:
+        # Colliding (supplier, vendor) pairs are dropped by the unique index
+        rng = self.rng("review", index)
+        supplier_index = self.supplier_of(skewed_index(rng, self.config.products, self.config.skew)) \
+            if self.config.products else skewed_index(rng, self.config.suppliers, self.config.skew)
+        return {
+            "id": seed_id(self.config.seed, "review", index),
+            "vendor_id": seed_id(self.config.seed, "vendor", rng.randrange(self.config.vendors)),
+            "supplier_id": seed_id(self.config.seed, "supplier", supplier_index),
+            "rating": rng.choices(*SEED_RATINGS)[0],
+            "comment": rng.choice(SEED_COMMENTS),
+            "created_at": self.moment(rng)
+        }
+
+seed_status = {"state": "idle", "config": None, "started_at": None, "finished_at": None,
+               "collections": {}, "rebuilt": {}, "error": None}
+
+async def seed_collection(name: str, count: int, make_document, config: SeedConfig):
+    progress = seed_status["collections"][name] = {"target": count, "inserted": 0, "existing": 0}
+    starts = iter(range(0, count, config.batch_size))
+    
+    # Workers share one iterator of batch offsets, so at most `concurrency` inserts are in flight
+    async def worker():
+        for start in starts:
+            documents = [make_document(i) for i in range(start, min(start + config.batch_size, count))]
+            try:
+                inserted = len((await db[name].insert_many(documents, ordered=False)).inserted_ids)
+            except BulkWriteError as exc:
+                # Duplicates are documents left by an earlier run with the same seed
+                if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                    raise
+                inserted = exc.details["nInserted"]
+            progress["inserted"] += inserted
+            progress["existing"] += len(documents) - inserted
+    
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+
+def reset_seed_status(config: SeedConfig):
+    seed_status.update(state="running", config=config.dict(), started_at=datetime.utcnow(),
+                       finished_at=None, collections={}, rebuilt={}, error=None)
+
+async def seed_data(config: SeedConfig) -> dict:
+    try:
+        # Re-runs only insert what is missing, and duplicate review pairs are dropped,
+        # because of the unique indexes; the CLI never builds them and the API may
+        # run before the startup build has finished
+        if (await ensure_indexes())["state"] != "ready":
+            raise RuntimeError("Indexes could not be built, see GET /api/admin/indexes")
+        
+        # All seeded accounts share one password, so it is hashed once
+        plan = SeedPlan(config, await hash_password(config.password))
+        await seed_collection("users", config.suppliers + config.vendors, plan.user, config)
+        await seed_collection("suppliers", config.suppliers, plan.supplier, config)
+        await seed_collection("products", config.products, plan.product, config)
+        if config.products:
+            await seed_collection("orders", config.orders, plan.order, config)
+        await seed_collection("reviews", config.reviews, plan.review, config)
+        
+        await bump_catalog_versions("*")
+        # Denormalized fields are derived the same way as for live data
+        seed_status["rebuilt"]["supplier_categories"] = await rebuild_supplier_categories()
+        seed_status["rebuilt"]["supplier_ratings"] = await rebuild_supplier_ratings()
+        seed_status["rebuilt"]["analytics"] = await rebuild_analytics_rollups()
+        seed_status["state"] = "done"
+    except Exception as exc:
+        seed_status.update(state="failed", error=str(exc))
+        logger.exception("Seeding failed")
+    finally:
+        seed_status["finished_at"] = datetime.utcnow()
+    return seed_status
 
 # Authentication Routes
 @api_router.post("/auth/register", response_model=Token)
@@ -199,7 +2268,7 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user = User(
         email=user_data.email,
         name=user_data.name,
@@ -209,10 +2278,14 @@ async def register(user_data: UserCreate):
     # Store user with hashed password
     user_dict = user.dict()
     user_dict["password"] = hashed_password
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create JWT token
-    token = create_jwt_token(user.id, user.email)
+    token = create_jwt_token(user)
     
     return Token(access_token=token, token_type="bearer", user=user)
 
@@ -224,36 +2297,57 @@ async def login(login_data: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(login_data.password, user_doc["password"]):
+    if not await verify_password(login_data.password, user_doc["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade hashes created with an outdated cost factor while we have the plaintext
+    if password_hasher.needs_rehash(user_doc["password"]):
+        password_hasher.stats["rehashes"] += 1
+        await db.users.update_one(
+            {"id": user_doc["id"], "password": user_doc["password"]},
+            {"$set": {"password": await hash_password(login_data.password)}}
+        )
+        invalidate_user(user_doc["id"])
+    
     user = User(**user_doc)
-    token = create_jwt_token(user.id, user.email)
+    token = create_jwt_token(user)
     
     return Token(access_token=token, token_type="bearer", user=user)
 
 # Supplier Routes
 @api_router.get("/suppliers", response_model=List[Supplier])
 async def get_suppliers(
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     min_rating: Optional[float] = None,
-    location: Optional[str] = None
+    location: Optional[str] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(page_params)
 ):
+    shape = SUPPLIER_SHAPE.select(fields)
+    cache_entry, cached = await catalog_cache.lookup(
+        request,
+        "GET /suppliers",
+        {"category": category, "min_rating": min_rating, "location": location, "fields": shape.selection,
+         **page.dict()},
+        ["suppliers"]
+    )
+    if cached is not None:
+        return cached
+    
     query = {}
     if category:
-        # Find suppliers that have products in this category
-        products = await db.products.find({"category": category}).to_list(100)
-        supplier_ids = list(set([p["supplier_id"] for p in products]))
-        query["id"] = {"$in": supplier_ids}
+        query["categories"] = category
     
     if min_rating:
         query["rating"] = {"$gte": min_rating}
     
     if location:
-        query["location"] = {"$regex": location, "$options": "i"}
+        query.update(location_filter(location))
     
-    suppliers = await db.suppliers.find(query).to_list(100)
-    return [Supplier(**supplier) for supplier in suppliers]
+    suppliers = await fetch_page(catalog_collection("suppliers"), query, page, response, projection=shape.projection)
+    return await catalog_cache.store(cache_entry, shape.documents(suppliers), response)
 
 @api_router.post("/suppliers", response_model=Supplier)
 async def create_supplier(supplier_data: SupplierCreate, current_user: User = Depends(get_current_user)):
@@ -270,9 +2364,45 @@ async def create_supplier(supplier_data: SupplierCreate, current_user: User = De
         **supplier_data.dict()
     )
     
-    await db.suppliers.insert_one(supplier.dict())
+    try:
+        await db.suppliers.insert_one(supplier_document(supplier.dict()))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Supplier profile already exists")
+    await bump_catalog_versions("suppliers")
     return supplier
 
+@api_router.get("/suppliers/nearby", response_model=List[NearbySupplier])
+async def get_nearby_suppliers(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(DEFAULT_NEARBY_RADIUS_KM, gt=0, le=MAX_NEARBY_RADIUS_KM),
+    category: Optional[str] = None,
+    min_rating: Optional[float] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
+):
+    shape = NEARBY_SUPPLIER_SHAPE.select(fields)
+    query = {}
+    if category:
+        query["categories"] = category
+    if min_rating:
+        query["rating"] = {"$gte": min_rating}
+    
+    # Results come back nearest first, served by the 2dsphere index on geo
+    suppliers = await catalog_collection("suppliers").aggregate([
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lng, lat]},
+            "distanceField": "distance_km",
+            "distanceMultiplier": 0.001,
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "query": query
+        }},
+        {"$limit": limit},
+        {"$project": shape.projection}
+    ]).to_list(None)
+    return fast_response(shape.documents(suppliers))
+
 @api_router.get("/suppliers/my-stall", response_model=Supplier)
 async def get_my_stall(current_user: User = Depends(get_current_user)):
     if current_user.user_type != "supplier":
@@ -287,11 +2417,27 @@ async def get_my_stall(current_user: User = Depends(get_current_user)):
 @api_router.get("/suppliers/{supplier_id}/products", response_model=List[Product])
 async def get_supplier_products(
     supplier_id: str,
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    min_quantity: Optional[int] = None
+    min_quantity: Optional[int] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(page_params)
 ):
+    shape = PRODUCT_SHAPE.select(fields)
+    cache_entry, cached = await catalog_cache.lookup(
+        request,
+        "GET /suppliers/{supplier_id}/products",
+        {"supplier_id": supplier_id, "category": category, "min_price": min_price, "max_price": max_price,
+         "min_quantity": min_quantity, "fields": shape.selection, **page.dict()},
+        [f"products:{supplier_id}"],
+        volatile=True
+    )
+    if cached is not None:
+        return cached
+    
     query = {"supplier_id": supplier_id}
     
     if category:
@@ -306,15 +2452,109 @@ async def get_supplier_products(
     if min_quantity:
         query["quantity_available"] = {"$gte": min_quantity}
     
-    products = await db.products.find(query).to_list(100)
-    return [Product(**product) for product in products]
+    products = await fetch_page(catalog_collection("products"), query, page, response, projection=shape.projection)
+    return await catalog_cache.store(cache_entry, shape.documents(products), response)
 
 @api_router.get("/suppliers/{supplier_id}/reviews", response_model=List[Review])
-async def get_supplier_reviews(supplier_id: str):
-    reviews = await db.reviews.find({"supplier_id": supplier_id}).to_list(100)
-    return [Review(**review) for review in reviews]
+async def get_supplier_reviews(
+    supplier_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(page_params)
+):
+    shape = REVIEW_SHAPE.select(fields)
+    cache_entry, cached = await catalog_cache.lookup(
+        request, "GET /suppliers/{supplier_id}/reviews",
+        {"supplier_id": supplier_id, "fields": shape.selection, **page.dict()},
+        [f"reviews:{supplier_id}"]
+    )
+    if cached is not None:
+        return cached
+    
+    reviews = await fetch_page(
+        catalog_collection("reviews"), {"supplier_id": supplier_id}, page, response, projection=shape.projection
+    )
+    return await catalog_cache.store(cache_entry, shape.documents(reviews), response)
 
 # Product Routes
+# Ranking and every facet are computed in one aggregation over the text index matches
+@api_router.get("/products/search", response_model=ProductSearchResponse)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    supplier_id: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = Query(20, ge=1, le=100),
+    skip: int = Query(0, ge=0, le=MAX_SEARCH_SKIP)
+):
+    match = {"$text": {"$search": q}}
+    if category:
+        match["category"] = category
+    if supplier_id:
+        match["supplier_id"] = supplier_id
+    if min_price is not None or max_price is not None:
+        match["price_per_unit"] = {}
+        if min_price is not None:
+            match["price_per_unit"]["$gte"] = min_price
+        if max_price is not None:
+            match["price_per_unit"]["$lte"] = max_price
+    
+    pipeline = [
+        {"$match": match},
+        {"$set": {"score": {"$meta": "textScore"}}},
+        {"$facet": {
+            "results": [
+                {"$sort": {"score": -1, "_id": 1}},
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": {"_id": 0}}
+            ],
+            "total": [{"$count": "count"}],
+            "categories": [{"$sortByCount": "$category"}],
+            "price_ranges": [{"$bucket": {
+                "groupBy": "$price_per_unit",
+                "boundaries": SEARCH_PRICE_BOUNDARIES,
+                "default": SEARCH_PRICE_BOUNDARIES[-1],
+                "output": {"count": {"$sum": 1}}
+            }}],
+            "suppliers": [
+                {"$sortByCount": "$supplier_id"},
+                {"$limit": SEARCH_SUPPLIER_FACETS},
+                {"$lookup": {
+                    "from": "suppliers",
+                    "localField": "_id",
+                    "foreignField": "id",
+                    "as": "supplier"
+                }}
+            ]
+        }}
+    ]
+    result = (await catalog_collection("products").aggregate(pipeline).to_list(1))[0]
+    
+    # $bucket puts prices past the last boundary in the default bucket, keyed by that boundary
+    upper_bounds = dict(zip(SEARCH_PRICE_BOUNDARIES, SEARCH_PRICE_BOUNDARIES[1:]))
+    return ProductSearchResponse(
+        total=result["total"][0]["count"] if result["total"] else 0,
+        results=[ProductSearchHit(**product) for product in result["results"]],
+        facets=SearchFacets(
+            categories=[FacetCount(value=c["_id"], count=c["count"]) for c in result["categories"]],
+            price_ranges=[
+                PriceBucket(min=b["_id"], max=upper_bounds.get(b["_id"]), count=b["count"])
+                for b in result["price_ranges"]
+            ],
+            suppliers=[
+                SupplierFacet(
+                    supplier_id=sup["_id"],
+                    stall_name=sup["supplier"][0]["stall_name"] if sup["supplier"] else None,
+                    count=sup["count"]
+                )
+                for sup in result["suppliers"]
+            ]
+        )
+    )
+
 @api_router.post("/products", response_model=Product)
 async def create_product(product_data: ProductCreate, current_user: User = Depends(get_current_user)):
     if current_user.user_type != "supplier":
@@ -331,19 +2571,87 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
     )
     
     await db.products.insert_one(product.dict())
+    await bump_catalog_versions(f"products:{supplier['id']}")
+    await add_supplier_category(supplier["id"], product.category)
+    enqueue_fanout({"type": "new_product", "product": product.dict()})
     return product
 
+# Bulk upsert from a CSV (header row, bulk_discount_tiers as JSON) or NDJSON upload.
+# New-product notifications are not sent for imported rows.
+@api_router.post("/products/import")
+async def import_products(
+    request: Request,
+    import_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=MAX_IMPORT_BATCH_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.user_type != "supplier":
+        raise HTTPException(status_code=403, detail="Only suppliers can import products")
+    
+    if import_format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        import_format = IMPORT_CONTENT_TYPES.get(content_type)
+        if import_format is None:
+            raise HTTPException(status_code=415, detail="Pass format=csv or format=ndjson")
+    
+    supplier = await db.suppliers.find_one({"user_id": current_user.id}, {"id": 1})
+    if not supplier:
+        raise HTTPException(status_code=404, detail="Supplier profile not found")
+    
+    records = csv_records if import_format == "csv" else ndjson_records
+    report = {"received": 0, "created": 0, "updated": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    batch = {}
+    async for row, record in records(stream_lines(request)):
+        report["received"] += 1
+        if isinstance(record, str):
+            record_import_error(report, row, record)
+            continue
+        try:
+            key, operation = import_operation(supplier["id"], record, datetime.utcnow())
+        except ValueError as exc:
+            record_import_error(report, row, validation_message(exc))
+            continue
+        # Unordered writes to the same product within a batch could apply in any order
+        if key in batch or len(batch) >= batch_size:
+            await write_import_batch(batch, report)
+            batch = {}
+        batch[key] = (row, operation)
+    if batch:
+        await write_import_batch(batch, report)
+    
+    if report["created"] or report["updated"]:
+        await bump_catalog_versions(f"products:{supplier['id']}")
+        await refresh_supplier_categories(supplier["id"])
+    return report
+
+@api_router.get("/products/export")
+async def export_products(params: ExportParams = Depends(export_params), current_user: User = Depends(get_current_user)):
+    if current_user.user_type != "supplier":
+        raise HTTPException(status_code=403, detail="Only suppliers can export products")
+    
+    supplier = await db.suppliers.find_one({"user_id": current_user.id}, {"id": 1})
+    if not supplier:
+        raise HTTPException(status_code=404, detail="Supplier profile not found")
+    
+    return await export_response("products", {"supplier_id": supplier["id"]}, params)
+
 @api_router.get("/products/my-products", response_model=List[Product])
-async def get_my_products(current_user: User = Depends(get_current_user)):
+async def get_my_products(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(page_params),
+    current_user: User = Depends(get_current_user)
+):
     if current_user.user_type != "supplier":
         raise HTTPException(status_code=403, detail="Only suppliers can access product data")
     
+    shape = PRODUCT_SHAPE.select(fields)
     supplier = await db.suppliers.find_one({"user_id": current_user.id})
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier profile not found")
     
-    products = await db.products.find({"supplier_id": supplier["id"]}).to_list(100)
-    return [Product(**product) for product in products]
+    products = await fetch_page(db.products, {"supplier_id": supplier["id"]}, page, response, projection=shape.projection)
+    return fast_response(shape.documents(products), response)
 
 @api_router.put("/products/{product_id}", response_model=Product)
 async def update_product(product_id: str, product_data: ProductUpdate, current_user: User = Depends(get_current_user)):
@@ -363,9 +2671,22 @@ async def update_product(product_id: str, product_data: ProductUpdate, current_u
     update_data = {k: v for k, v in product_data.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.products.update_one({"id": product_id}, {"$set": update_data})
+    await db.products.update_one({"id": product_id}, product_update(update_data))
+    await bump_catalog_versions(f"products:{supplier['id']}")
+    
+    if update_data.get("category", product["category"]) != product["category"]:
+        await add_supplier_category(supplier["id"], update_data["category"])
+        await prune_supplier_category(supplier["id"], product["category"])
     
     updated_product = await db.products.find_one({"id": product_id})
+    
+    if updated_product["price_per_unit"] < product["price_per_unit"]:
+        enqueue_fanout({"type": "price_drop", "product": updated_product, "old_price": product["price_per_unit"]})
+    old_best = TierSchedule(product.get("bulk_discount_tiers")).best_tier()
+    new_best = TierSchedule(updated_product.get("bulk_discount_tiers")).best_tier()
+    if new_best and (not old_best or new_best[1] > old_best[1]):
+        enqueue_fanout({"type": "bulk_discount", "product": updated_product})
+    
     return Product(**updated_product)
 
 @api_router.delete("/products/{product_id}")
@@ -377,10 +2698,16 @@ async def delete_product(product_id: str, current_user: User = Depends(get_curre
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier profile not found")
     
-    result = await db.products.delete_one({"id": product_id, "supplier_id": supplier["id"]})
-    if result.deleted_count == 0:
+    product = await db.products.find_one_and_delete(
+        {"id": product_id, "supplier_id": supplier["id"]},
+        projection={"category": 1}
+    )
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    await bump_catalog_versions(f"products:{supplier['id']}")
+    await prune_supplier_category(supplier["id"], product["category"])
+    
     return {"message": "Product deleted successfully"}
 
 # Review Routes
@@ -389,174 +2716,630 @@ async def create_review(review_data: ReviewCreate, current_user: User = Depends(
     if current_user.user_type != "vendor":
         raise HTTPException(status_code=403, detail="Only vendors can create reviews")
     
-    # Check if review already exists
-    existing = await db.reviews.find_one({
-        "vendor_id": current_user.id,
-        "supplier_id": review_data.supplier_id
-    })
-    if existing:
-        raise HTTPException(status_code=400, detail="Review already exists for this supplier")
-    
     review = Review(
         vendor_id=current_user.id,
         **review_data.dict()
     )
     
-    await db.reviews.insert_one(review.dict())
-    
-    # Update supplier rating
-    reviews = await db.reviews.find({"supplier_id": review_data.supplier_id}).to_list(100)
-    avg_rating = sum([r["rating"] for r in reviews]) / len(reviews)
+    # The unique (supplier_id, vendor_id) index enforces one review per supplier
+    try:
+        await db.reviews.insert_one(review.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Review already exists for this supplier")
     
-    await db.suppliers.update_one(
-        {"id": review_data.supplier_id},
-        {"$set": {"rating": round(avg_rating, 1), "total_reviews": len(reviews)}}
-    )
+    await add_supplier_rating(review.supplier_id, review.rating)
+    await bump_catalog_versions(f"reviews:{review.supplier_id}", "suppliers")
     
     return review
 
 # Notification Routes
 @api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications(current_user: User = Depends(get_current_user)):
-    notifications = await db.notifications.find({"user_id": current_user.id}).sort("created_at", -1).to_list(50)
-    return [Notification(**notif) for notif in notifications]
+async def get_notifications(
+    response: Response,
+    limit: int = Query(NOTIFICATION_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    include_total: bool = False,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    current_user: User = Depends(get_current_user)
+):
+    shape = NOTIFICATION_SHAPE.select(fields)
+    # Newest first: _id order follows creation order
+    page = PageParams(limit=limit, after=after, include_total=include_total)
+    notifications = await fetch_page(db.notifications, {"user_id": current_user.id}, page, response,
+                                     direction=DESCENDING, projection=shape.projection)
+    return fast_response(shape.documents(notifications), response)
+
+@api_router.get("/notifications/unread-count")
+async def get_unread_count(current_user: User = Depends(get_current_user)):
+    counter = await db.notification_counters.find_one({"user_id": current_user.id}, {"_id": 0, "unread": 1})
+    if counter is None:
+        # First request for this user: seed the counter from their existing notifications
+        unread = await db.notifications.count_documents({"user_id": current_user.id, "is_read": False})
+        await db.notification_counters.update_one(
+            {"user_id": current_user.id},
+            {"$setOnInsert": {"unread": unread}},
+            upsert=True
+        )
+        return {"unread": unread}
+    if counter["unread"] < 0:
+        # Returned as stored so the drift shows; rebuild-notification-counters repairs it
+        logger.warning(f"Unread counter for user {current_user.id} is negative: {counter['unread']}")
+    return {"unread": counter["unread"]}
+
+@api_router.post("/notifications/stream-token")
+async def create_stream_token(current_user: User = Depends(get_current_user)):
+    ticket = await issue_stream_ticket(current_user.id)
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL_SECONDS}
+
+# Server-sent events: each new notification arrives as a "notification" event,
+# with comment heartbeats keeping idle connections open through proxies
+@api_router.get("/notifications/stream")
+async def stream_notifications(request: Request, current_user: User = Depends(get_stream_user)):
+    queue = notification_hub.subscribe(current_user.id)
+    
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=NOTIFICATION_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event)}\n\n"
+        finally:
+            notification_hub.unsubscribe(current_user.id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Applies one action to many notifications: those listed in ids, or all of the
+# user's notifications created before older_than (or both, combined)
+@api_router.post("/notifications/bulk")
+async def bulk_update_notifications(action: NotificationBulkAction, current_user: User = Depends(get_current_user)):
+    if not action.ids and action.older_than is None:
+        raise HTTPException(status_code=400, detail="Provide ids or older_than")
+    
+    query = {"user_id": current_user.id}
+    if action.ids:
+        query["id"] = {"$in": action.ids}
+    if action.older_than is not None:
+        query["created_at"] = {"$lt": action.older_than}
+    
+    if action.action == "read":
+        result = await db.notifications.update_many(
+            {**query, "is_read": False},
+            {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
+        )
+        affected = result.modified_count
+        await adjust_unread_count(current_user.id, -affected)
+    elif action.action == "unread":
+        result = await db.notifications.update_many(
+            {**query, "is_read": True},
+            {"$set": {"is_read": False}, "$unset": {"read_at": ""}}
+        )
+        affected = result.modified_count
+        await adjust_unread_count(current_user.id, affected)
+    else:
+        # Unread ones are deleted separately so the counter knows how many went
+        unread = await db.notifications.delete_many({**query, "is_read": False})
+        read = await db.notifications.delete_many({**query, "is_read": True})
+        affected = unread.deleted_count + read.deleted_count
+        await adjust_unread_count(current_user.id, -unread.deleted_count)
+    
+    return {"message": f"Notifications updated: {action.action}", "affected": affected}
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: User = Depends(get_current_user)):
     result = await db.notifications.update_one(
-        {"id": notification_id, "user_id": current_user.id},
-        {"$set": {"is_read": True}}
+        {"id": notification_id, "user_id": current_user.id, "is_read": False},
+        {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
     )
     if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Notification not found")
+        # Already read (read_at is left alone so its expiry doesn't move) or not found
+        exists = await db.notifications.find_one({"id": notification_id, "user_id": current_user.id}, {"_id": 1})
+        if not exists:
+            raise HTTPException(status_code=404, detail="Notification not found")
+        return {"message": "Notification marked as read"}
     
+    await adjust_unread_count(current_user.id, -1)
     return {"message": "Notification marked as read"}
 
+# Pricing Routes
+# Prices any number of lines (up to MAX_QUOTE_LINES) with one product lookup
+@api_router.post("/pricing/quote", response_model=QuoteResponse)
+async def quote_prices(quote: QuoteRequest):
+    product_ids = list({line.product_id for line in quote.items})
+    products = await db.products.find(
+        {"id": {"$in": product_ids}},
+        {**PRICING_PROJECTION, "name": 1, "supplier_id": 1, "quantity_available": 1}
+    ).to_list(None)
+    products_by_id = {p["id"]: p for p in products}
+    
+    lines = []
+    for line in quote.items:
+        product = products_by_id.get(line.product_id)
+        if product is None:
+            lines.append(QuotedLine(product_id=line.product_id, quantity=line.quantity))
+            continue
+        lines.append(QuotedLine(
+            product_id=line.product_id,
+            quantity=line.quantity,
+            name=product.get("name"),
+            supplier_id=product["supplier_id"],
+            available=product["quantity_available"] >= line.quantity,
+            **pricing_engine.price_line(product, line.quantity)
+        ))
+    
+    subtotal = round(sum(line.subtotal for line in lines), 2)
+    total = round(sum(line.total for line in lines), 2)
+    return QuoteResponse(items=lines, subtotal=subtotal, discount_amount=round(subtotal - total, 2), total_amount=total)
+
 # Cart Routes
-@api_router.get("/cart", response_model=Cart)
+# Joins each cart line with its product and supplier in a single aggregation
+# (alongside one read of the vendor's stock holds), so enrichment costs constant
+# round-trips regardless of cart size
+async def enrich_cart_items(vendor_id: str, items: List[CartItem]) -> List[CartItemDetails]:
+    if not items:
+        return []
+    
+    product_ids = list({item.product_id for item in items})
+    products, holds = await asyncio.gather(
+        db.products.aggregate([
+            {"$match": {"id": {"$in": product_ids}}},
+            {"$lookup": {
+                "from": "suppliers",
+                "localField": "supplier_id",
+                "foreignField": "id",
+                "as": "supplier"
+            }},
+            {"$project": {
+                **PRICING_PROJECTION,
+                "name": 1,
+                "quantity_available": 1,
+                "supplier_name": {"$arrayElemAt": ["$supplier.stall_name", 0]}
+            }}
+        ]).to_list(None),
+        db.reservations.find(
+            {"vendor_id": vendor_id, "status": "held"},
+            {"_id": 0, "product_id": 1, "quantity": 1}
+        ).to_list(None)
+    )
+    products_by_id = {p["id"]: p for p in products}
+    # Stock this vendor holds is already deducted from quantity_available
+    held = {hold["product_id"]: hold["quantity"] for hold in holds}
+    
+    enriched = []
+    for item in items:
+        details = CartItemDetails(**item.dict())
+        product = products_by_id.get(item.product_id)
+        if product is None:
+            details.name = details.name or "Unknown Product"
+            details.available = False
+            details.line_total = round(item.quantity * item.price_per_unit, 2)
+        else:
+            details.name = product.get("name", "Unknown Product")
+            details.current_price = product["price_per_unit"]
+            details.quantity_available = product["quantity_available"]
+            details.supplier_name = product.get("supplier_name")
+            details.price_changed = product["price_per_unit"] != item.price_per_unit
+            details.available = product["quantity_available"] + held.get(item.product_id, 0) >= item.quantity
+            price = pricing_engine.price_line(product, item.quantity, item.price_per_unit)
+            details.discount_rate = price["discount_rate"]
+            details.line_total = price["total"]
+        enriched.append(details)
+    return enriched
+
+@api_router.get("/cart", response_model=CartDetails)
 async def get_cart(current_user: User = Depends(get_current_user)):
     cart = await db.carts.find_one({"vendor_id": current_user.id})
     if not cart:
         # Create empty cart
         empty_cart = Cart(vendor_id=current_user.id)
-        await db.carts.insert_one(empty_cart.dict())
-        return empty_cart
-    
-    cart_obj = Cart(**cart)
-    
-    # Enrich cart items with product names
-    for item in cart_obj.items:
-        product = await db.products.find_one({"id": item.product_id})
-        if product:
-            item.name = product.get("name", "Unknown Product")
+        try:
+            await db.carts.insert_one(empty_cart.dict())
+        except DuplicateKeyError:
+            # A concurrent request created it first
+            pass
+        return CartDetails(**empty_cart.dict())
+    
+    cart_obj = CartDetails(**cart)
+    cart_obj.items = await enrich_cart_items(current_user.id, cart_obj.items)
+    cart_obj.has_changes = any(item.price_changed or not item.available for item in cart_obj.items)
+    
+    # The stored total is the undiscounted subtotal; bulk discounts use the current tiers
+    cart_obj.subtotal = round(sum(item.quantity * item.price_per_unit for item in cart_obj.items), 2)
+    cart_obj.total_amount = round(sum(item.line_total for item in cart_obj.items), 2)
+    cart_obj.discount_amount = round(cart_obj.subtotal - cart_obj.total_amount, 2)
     
     return cart_obj
 
-@api_router.post("/cart/add")
-async def add_to_cart(cart_item: CartItem, current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"vendor_id": current_user.id})
-    
-    if not cart:
-        # Create new cart
-        new_cart = Cart(vendor_id=current_user.id, items=[cart_item])
-        new_cart.total_amount = cart_item.quantity * cart_item.price_per_unit
-        await db.carts.insert_one(new_cart.dict())
-        return {"message": "Item added to cart"}
-    
-    # Update existing cart
-    cart_obj = Cart(**cart)
-    
-    # Check if product already in cart
-    existing_item = None
-    for item in cart_obj.items:
-        if item.product_id == cart_item.product_id:
-            existing_item = item
-            break
-    
-    if existing_item:
-        existing_item.quantity += cart_item.quantity
-    else:
-        cart_obj.items.append(cart_item)
-    
-    # Recalculate total
-    cart_obj.total_amount = sum(item.quantity * item.price_per_unit for item in cart_obj.items)
-    cart_obj.updated_at = datetime.utcnow()
-    
-    await db.carts.replace_one({"vendor_id": current_user.id}, cart_obj.dict())
-    return {"message": "Item added to cart"}
+# Cart mutations are single pipeline updates: the line change, total_amount and
+# version are recomputed together on the server, so each mutation is one atomic
+# round-trip and concurrent writers from several devices never clobber each other.
+# User-supplied values are wrapped in $literal so they can't be read as field paths.
+def cart_items_with(product_id: str, update_expr: dict, append: Optional[dict] = None) -> dict:
+    # Applies update_expr to the line for product_id, or appends a new line if missing
+    missing = {"$concatArrays": ["$$items", [{"$literal": append}]]} if append else "$$items"
+    return {"$let": {
+        "vars": {"items": {"$ifNull": ["$items", []]}},
+        "in": {"$cond": [
+            {"$in": [{"$literal": product_id}, "$$items.product_id"]},
+            {"$map": {
+                "input": "$$items",
+                "as": "item",
+                "in": {"$cond": [
+                    {"$eq": ["$$item.product_id", {"$literal": product_id}]},
+                    {"$mergeObjects": ["$$item", update_expr]},
+                    "$$item"
+                ]}
+            }},
+            missing
+        ]}
+    }}
 
-@api_router.delete("/cart/remove/{product_id}")
-async def remove_from_cart(product_id: str, current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"vendor_id": current_user.id})
+def cart_items_without(product_id: str) -> dict:
+    return {"$filter": {
+        "input": "$items",
+        "as": "item",
+        "cond": {"$ne": ["$$item.product_id", {"$literal": product_id}]}
+    }}
+
+async def update_cart(vendor_id: str, items_expr: dict, query: Optional[dict] = None,
+                      expected_version: Optional[int] = None, upsert: bool = False) -> Optional[dict]:
+    query = {"vendor_id": vendor_id, **(query or {})}
+    if expected_version is not None:
+        # Carts written before versioning have no version field and count as version 0
+        query["version"] = expected_version if expected_version else {"$in": [0, None]}
+    
+    now = datetime.utcnow()
+    pipeline = [
+        {"$set": {
+            "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+            "created_at": {"$ifNull": ["$created_at", now]},
+            "items": items_expr,
+            "updated_at": now,
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+        }},
+        {"$set": {
+            "total_amount": {"$sum": {"$map": {
+                "input": "$items",
+                "as": "item",
+                "in": {"$multiply": ["$$item.quantity", "$$item.price_per_unit"]}
+            }}}
+        }}
+    ]
     
+    for _ in range(CART_WRITE_RETRIES):
+        try:
+            return await db.carts.find_one_and_update(
+                query,
+                pipeline,
+                projection={"_id": 0, "version": 1, "total_amount": 1},
+                upsert=upsert,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Two first writes raced to create the cart; retrying updates the winner's document
+            continue
+    raise HTTPException(status_code=409, detail="Cart is being modified concurrently, please retry")
+
+async def raise_cart_miss(vendor_id: str, product_id: str, expected_version: Optional[int]):
+    # Only reached when the update matched nothing, to report why
+    cart = await db.carts.find_one(
+        {"vendor_id": vendor_id},
+        {"_id": 0, "version": 1, "items": {"$elemMatch": {"product_id": product_id}}}
+    )
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
-    
-    cart_obj = Cart(**cart)
-    
-    # Find and remove the item
-    item_to_remove = None
-    for item in cart_obj.items:
-        if item.product_id == product_id:
-            item_to_remove = item
-            break
-    
-    if not item_to_remove:
+    if not cart.get("items"):
         raise HTTPException(status_code=404, detail="Item not found in cart")
+    if expected_version is not None and cart.get("version", 0) != expected_version:
+        raise HTTPException(status_code=409, detail="Cart was modified, reload and retry")
+    raise HTTPException(status_code=409, detail="Cart update conflict, please retry")
+
+@api_router.post("/cart/add")
+async def add_to_cart(
+    cart_item: CartItem,
+    expected_version: Optional[int] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    if cart_item.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    
+    # Stock is held before the cart changes; price and supplier come from the product, not the client
+    product = await reserve_stock(current_user.id, cart_item.product_id, cart_item.quantity)
+    cart_item = CartItem(
+        product_id=product["id"],
+        supplier_id=product["supplier_id"],
+        quantity=cart_item.quantity,
+        price_per_unit=product["price_per_unit"],
+        name=product.get("name")
+    )
     
-    cart_obj.items.remove(item_to_remove)
-    
-    # Recalculate total
-    cart_obj.total_amount = sum(item.quantity * item.price_per_unit for item in cart_obj.items)
-    cart_obj.updated_at = datetime.utcnow()
+    # Anything that fails between reserving and writing the cart must give the hold back
+    try:
+        items = cart_items_with(
+            cart_item.product_id,
+            {"quantity": {"$add": ["$$item.quantity", cart_item.quantity]}},
+            append=cart_item.dict()
+        )
+        cart = await update_cart(
+            current_user.id,
+            items,
+            expected_version=expected_version,
+            upsert=expected_version is None
+        )
+    except Exception:
+        await release_stock(current_user.id, cart_item.product_id, cart_item.quantity)
+        raise
+    if cart is None:
+        await release_stock(current_user.id, cart_item.product_id, cart_item.quantity)
+        raise HTTPException(status_code=409, detail="Cart was modified, reload and retry")
+    
+    return {"message": "Item added to cart", "version": cart["version"]}
+
+@api_router.delete("/cart/remove/{product_id}")
+async def remove_from_cart(
+    product_id: str,
+    expected_version: Optional[int] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    cart = await update_cart(
+        current_user.id,
+        cart_items_without(product_id),
+        query={"items.product_id": product_id},
+        expected_version=expected_version
+    )
+    if cart is None:
+        await raise_cart_miss(current_user.id, product_id, expected_version)
     
-    await db.carts.replace_one({"vendor_id": current_user.id}, cart_obj.dict())
-    return {"message": "Item removed from cart"}
+    await release_stock(current_user.id, product_id)
+    return {"message": "Item removed from cart", "version": cart["version"]}
 
 @api_router.put("/cart/update/{product_id}")
-async def update_cart_item(product_id: str, quantity: int = Query(...), current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"vendor_id": current_user.id})
-    
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    cart_obj = Cart(**cart)
-    
-    # Find and update the item
-    item_to_update = None
-    for item in cart_obj.items:
-        if item.product_id == product_id:
-            item_to_update = item
-            break
-    
-    if not item_to_update:
-        raise HTTPException(status_code=404, detail="Item not found in cart")
-    
+async def update_cart_item(
+    product_id: str,
+    quantity: int = Query(...),
+    expected_version: Optional[int] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
     if quantity <= 0:
-        cart_obj.items.remove(item_to_update)
+        items = cart_items_without(product_id)
     else:
-        item_to_update.quantity = quantity
-    
-    # Recalculate total
-    cart_obj.total_amount = sum(item.quantity * item.price_per_unit for item in cart_obj.items)
-    cart_obj.updated_at = datetime.utcnow()
+        items = cart_items_with(product_id, {"quantity": {"$literal": quantity}})
+    
+    # The hold is adjusted by the change in quantity, so the update is checked
+    # against the version the current quantity was read at
+    for _ in range(CART_WRITE_RETRIES):
+        cart = await db.carts.find_one(
+            {"vendor_id": current_user.id},
+            {"_id": 0, "version": 1, "items": {"$elemMatch": {"product_id": product_id}}}
+        )
+        if not cart:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        if not cart.get("items"):
+            raise HTTPException(status_code=404, detail="Item not found in cart")
+        version = cart.get("version", 0)
+        if expected_version is not None and version != expected_version:
+            raise HTTPException(status_code=409, detail="Cart was modified, reload and retry")
+        
+        delta = max(quantity, 0) - cart["items"][0]["quantity"]
+        if delta > 0:
+            await reserve_stock(current_user.id, product_id, delta)
+        try:
+            cart = await update_cart(
+                current_user.id,
+                items,
+                query={"items.product_id": product_id},
+                expected_version=version
+            )
+        except Exception:
+            if delta > 0:
+                await release_stock(current_user.id, product_id, delta)
+            raise
+        
+        if cart is None:
+            # Changed concurrently: undo this attempt's hold and re-read
+            if delta > 0:
+                await release_stock(current_user.id, product_id, delta)
+            if expected_version is not None:
+                raise HTTPException(status_code=409, detail="Cart was modified, reload and retry")
+            continue
+        
+        if delta < 0:
+            await release_stock(current_user.id, product_id, -delta)
+        return {"message": "Cart updated", "version": cart["version"]}
     
-    await db.carts.replace_one({"vendor_id": current_user.id}, cart_obj.dict())
-    return {"message": "Cart updated"}
+    raise HTTPException(status_code=409, detail="Cart is being modified concurrently, please retry")
 
 # Orders Routes
 @api_router.get("/orders/my-orders", response_model=List[Order])
-async def get_my_orders(current_user: User = Depends(get_current_user)):
+async def get_my_orders(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(page_params),
+    current_user: User = Depends(get_current_user)
+):
+    shape = ORDER_SHAPE.select(fields)
     if current_user.user_type == "vendor":
-        orders = await db.orders.find({"vendor_id": current_user.id}).to_list(100)
+        orders = await fetch_page(db.orders, {"vendor_id": current_user.id}, page, response, projection=shape.projection)
     else:  # supplier
-        orders = await db.orders.find({"supplier_id": current_user.id}).to_list(100)
+        # Orders reference the supplier profile, not the user account
+        supplier = await db.suppliers.find_one({"user_id": current_user.id}, {"id": 1})
+        if not supplier:
+            raise HTTPException(status_code=404, detail="Supplier profile not found")
+        orders = await fetch_page(db.orders, {"supplier_id": supplier["id"]}, page, response, projection=shape.projection)
+    
+    return fast_response(shape.documents(orders), response)
+
+@api_router.get("/orders/export")
+async def export_orders(params: ExportParams = Depends(export_params), current_user: User = Depends(get_current_user)):
+    if current_user.user_type == "vendor":
+        return await export_response("orders", {"vendor_id": current_user.id}, params)
+    
+    supplier = await db.suppliers.find_one({"user_id": current_user.id}, {"id": 1})
+    if not supplier:
+        raise HTTPException(status_code=404, detail="Supplier profile not found")
+    return await export_response("orders", {"supplier_id": supplier["id"]}, params)
+
+# Runs inside the checkout transaction. Round-trips are constant in the cart size:
+# read cart, holds and products, one bulk of stock adjustments, converting the
+# holds, one insert_many for the orders, and one update to clear the cart.
+async def place_orders(vendor_id: str, expected_version: Optional[int], session) -> List[Order]:
+    cart = await db.carts.find_one({"vendor_id": vendor_id}, session=session)
+    if not cart or not cart.get("items"):
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    if expected_version is not None and cart.get("version", 0) != expected_version:
+        raise HTTPException(status_code=409, detail="Cart was modified, reload and retry")
+    
+    items = [CartItem(**item) for item in cart["items"]]
+    holds = await db.reservations.find(
+        {"vendor_id": vendor_id, "status": "held"},
+        {"_id": 0, "product_id": 1, "quantity": 1},
+        session=session
+    ).to_list(None)
+    
+    # Held stock is already deducted; only the remainder (e.g. after a hold expired)
+    # is taken now, and holds for products no longer in the cart are returned
+    held = {}
+    for hold in holds:
+        held[hold["product_id"]] = held.get(hold["product_id"], 0) + hold["quantity"]
+    adjustments = dict(held)
+    for item in items:
+        adjustments[item.product_id] = adjustments.get(item.product_id, 0) - item.quantity
+    
+    products = await db.products.find(
+        {"id": {"$in": [item.product_id for item in items]}},
+        {**PRICING_PROJECTION, "name": 1, "supplier_id": 1, "quantity_available": 1},
+        session=session
+    ).to_list(None)
+    products_by_id = {p["id"]: p for p in products}
+    
+    unavailable = [
+        item.product_id for item in items
+        if item.product_id not in products_by_id
+        or products_by_id[item.product_id]["quantity_available"] < -adjustments[item.product_id]
+    ]
+    if unavailable:
+        raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "product_ids": unavailable})
+    
+    now = datetime.utcnow()
+    # Every held unit stops being reserved, converted or returned. The quantity guard
+    # makes each decrement conditional, so stock can never go negative
+    operations = []
+    for pid, change in adjustments.items():
+        inc = {"quantity_available": change, "quantity_reserved": -held.get(pid, 0)}
+        if change < 0:
+            operations.append(UpdateOne(
+                {"id": pid, "quantity_available": {"$gte": -change}},
+                {"$inc": inc, "$set": {"updated_at": now}}
+            ))
+        else:
+            operations.append(UpdateOne({"id": pid}, {"$inc": inc}))
+    if operations:
+        result = await db.products.bulk_write(operations, ordered=False, session=session)
+        if result.matched_count != len(operations):
+            raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "product_ids": []})
+    
+    if holds:
+        await db.reservations.update_many(
+            {"vendor_id": vendor_id, "status": "held"},
+            {"$set": {
+                "status": "converted",
+                "updated_at": now,
+                "purge_at": now + timedelta(hours=RESERVATION_RETENTION_HOURS)
+            }},
+            session=session
+        )
+    
+    # One order per supplier, priced at the products' current prices and bulk tiers
+    lines_by_supplier = {}
+    for item in items:
+        product = products_by_id[item.product_id]
+        price = pricing_engine.price_line(product, item.quantity)
+        lines_by_supplier.setdefault(product["supplier_id"], []).append((OrderItem(
+            product_id=item.product_id,
+            supplier_id=product["supplier_id"],
+            quantity=item.quantity,
+            price_per_unit=price["unit_price"],
+            name=product.get("name"),
+            discount_rate=price["discount_rate"]
+        ), price))
+    orders = [
+        Order(
+            vendor_id=vendor_id,
+            supplier_id=supplier_id,
+            items=[line for line, _ in lines],
+            subtotal=round(sum(price["subtotal"] for _, price in lines), 2),
+            discount_amount=round(sum(price["discount_amount"] for _, price in lines), 2),
+            total_amount=round(sum(price["total"] for _, price in lines), 2),
+            created_at=now
+        )
+        for supplier_id, lines in lines_by_supplier.items()
+    ]
+    await db.orders.insert_many([order.dict() for order in orders], session=session)
+    
+    await db.carts.update_one(
+        {"vendor_id": vendor_id},
+        {"$set": {"items": [], "total_amount": 0.0, "updated_at": now}, "$inc": {"version": 1}},
+        session=session
+    )
+    return orders
+
+async def commit_with_retry(session):
+    for attempt in range(CHECKOUT_MAX_RETRIES):
+        try:
+            await session.commit_transaction()
+            return
+        except PyMongoError as e:
+            if e.has_error_label("UnknownTransactionCommitResult") and attempt + 1 < CHECKOUT_MAX_RETRIES:
+                continue
+            raise
+
+@api_router.post("/checkout", response_model=CheckoutResult)
+async def checkout(expected_version: Optional[int] = Query(None), current_user: User = Depends(get_current_user)):
+    if current_user.user_type != "vendor":
+        raise HTTPException(status_code=403, detail="Only vendors can check out")
+    
+    async with await client.start_session() as session:
+        for attempt in range(CHECKOUT_MAX_RETRIES):
+            session.start_transaction(read_preference=ReadPreference.PRIMARY)
+            try:
+                orders = await place_orders(current_user.id, expected_version, session)
+                await commit_with_retry(session)
+                break
+            except PyMongoError as e:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                if e.has_error_label("TransientTransactionError") and attempt + 1 < CHECKOUT_MAX_RETRIES:
+                    continue
+                logger.error(f"Checkout failed for vendor {current_user.id}: {e}")
+                raise HTTPException(status_code=503, detail="Checkout could not be completed, please retry")
+            except HTTPException:
+                await session.abort_transaction()
+                raise
+    
+    # Order events are applied after commit; a failure here is repaired by rebuilding the rollups
+    try:
+        await record_order_rollups([order.dict() for order in orders])
+    except PyMongoError as e:
+        logger.error(f"Failed to record analytics for vendor {current_user.id} checkout: {e}")
     
-    return [Order(**order) for order in orders]
+    return CheckoutResult(orders=orders, total_amount=round(sum(order.total_amount for order in orders), 2))
 
 # Analytics Routes (for suppliers)
 @api_router.get("/analytics/dashboard")
-async def get_supplier_analytics(current_user: User = Depends(get_current_user)):
+async def get_supplier_analytics(
+    days: int = Query(30, ge=1, le=365),
+    hours: int = Query(24, ge=1, le=168),
+    current_user: User = Depends(get_current_user)
+):
     if current_user.user_type != "supplier":
         raise HTTPException(status_code=403, detail="Only suppliers can access analytics")
     
@@ -564,28 +3347,130 @@ async def get_supplier_analytics(current_user: User = Depends(get_current_user))
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier profile not found")
     
-    # Get product count
-    product_count = await db.products.count_documents({"supplier_id": supplier["id"]})
-    
-    # Get orders count
-    orders_count = await db.orders.count_documents({"supplier_id": supplier["id"]})
-    
-    # Get total revenue (mock data for now)
-    total_revenue = orders_count * 150.0  # Mock calculation
+    now = datetime.utcnow()
+    since_day = rollup_bucket(now, "day") - timedelta(days=days - 1)
+    since_hour = rollup_bucket(now, "hour") - timedelta(hours=hours - 1)
+    
+    # The product count is served from the supplier_id index; everything else
+    # comes from a handful of precomputed rollup documents
+    product_count, rollups = await asyncio.gather(
+        db.products.count_documents({"supplier_id": supplier["id"]}),
+        db.supplier_rollups.find({
+            "supplier_id": supplier["id"],
+            "$or": [
+                {"granularity": "all"},
+                {"granularity": "day", "bucket": {"$gte": since_day}},
+                {"granularity": "hour", "bucket": {"$gte": since_hour}}
+            ]
+        }, {"_id": 0}).sort("bucket", ASCENDING).to_list(None)
+    )
     
-    # Get top products (mock data)
-    products = await db.products.find({"supplier_id": supplier["id"]}).to_list(5)
-    top_products = [{"name": p["name"], "sales": 25} for p in products[:3]]
+    totals = next((r for r in rollups if r["granularity"] == "all"), {})
+    products = totals.get("products", {})
+    top_products = sorted(
+        ({"product_id": pid, "name": p.get("name"), "sales": p["units"], "revenue": p["revenue"]}
+         for pid, p in products.items()),
+        key=lambda p: p["sales"],
+        reverse=True
+    )[:ANALYTICS_TOP_PRODUCTS]
     
     return {
         "total_products": product_count,
-        "total_orders": orders_count,
-        "total_revenue": total_revenue,
+        "total_orders": totals.get("orders_count", 0),
+        "total_revenue": totals.get("revenue", 0.0),
+        "total_units": totals.get("units", 0),
+        "average_order_value": average_order_value(totals),
         "top_products": top_products,
+        "daily": [rollup_point(r) for r in rollups if r["granularity"] == "day"],
+        "hourly": [rollup_point(r) for r in rollups if r["granularity"] == "hour"],
         "rating": supplier["rating"],
         "total_reviews": supplier["total_reviews"]
     }
 
+# Admin Routes
+@api_router.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    return {
+        "password_hashing": password_hasher.metrics(),
+        "user_cache": user_cache.metrics(),
+        "reservations": reservation_stats,
+        "pricing_schedules": pricing_engine.schedules.metrics(),
+        "notification_stream": notification_hub.metrics(),
+        "notification_fanout": {**fanout_stats, "queued": fanout_queue.qsize()},
+        "catalog_cache": catalog_cache.metrics(),
+        "mongo_pool": {
+            **pool_stats.metrics(),
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "catalog_read_preference": MONGO_READ_PREFERENCE,
+        }
+    }
+
+@api_router.get("/admin/indexes", dependencies=[Depends(require_admin)])
+async def get_index_status():
+    return index_status
+
+@api_router.post("/admin/indexes", dependencies=[Depends(require_admin)])
+async def rebuild_indexes():
+    return await ensure_indexes()
+
+@api_router.post("/admin/rebuild/supplier-categories", dependencies=[Depends(require_admin)])
+async def rebuild_categories():
+    return await rebuild_supplier_categories()
+
+@api_router.post("/admin/rebuild/supplier-locations", dependencies=[Depends(require_admin)])
+async def rebuild_locations():
+    return await rebuild_supplier_locations()
+
+@api_router.post("/admin/rebuild/supplier-ratings", dependencies=[Depends(require_admin)])
+async def rebuild_ratings():
+    return await rebuild_supplier_ratings()
+
+@api_router.post("/admin/rebuild/analytics", dependencies=[Depends(require_admin)])
+async def rebuild_analytics(supplier_id: Optional[str] = None):
+    return await rebuild_analytics_rollups(supplier_id)
+
+@api_router.post("/admin/reservations/sweep", dependencies=[Depends(require_admin)])
+async def sweep_reservations():
+    return {"holds_released": await sweep_expired_reservations()}
+
+@api_router.post("/admin/rebuild/reserved-stock", dependencies=[Depends(require_admin)])
+async def rebuild_reserved():
+    return await rebuild_reserved_stock()
+
+@api_router.post("/admin/rebuild/notification-counters", dependencies=[Depends(require_admin)])
+async def rebuild_unread_counters():
+    return await rebuild_notification_counters()
+
+@api_router.get("/admin/export/{collection}", dependencies=[Depends(require_admin)])
+async def export_collection(collection: Literal["products", "orders", "reviews"], params: ExportParams = Depends(export_params)):
+    return await export_response(collection, {}, params)
+
+# Seeding runs in the background; poll GET /admin/seed for progress
+@api_router.post("/admin/seed", dependencies=[Depends(require_admin)])
+async def start_seed(config: SeedConfig):
+    if seed_status["state"] == "running":
+        raise HTTPException(status_code=409, detail="Seeding already in progress")
+    # Marked running before the task starts so a concurrent request sees it
+    reset_seed_status(config)
+    start_background_task(seed_data(config))
+    return seed_status
+
+@api_router.get("/admin/seed", dependencies=[Depends(require_admin)])
+async def get_seed_status():
+    return seed_status
+
+@api_router.get("/admin/query-plans", dependencies=[Depends(require_admin)])
+async def get_query_plans():
+    plans = await explain_query_plans()
+    return {"collscans": sum(p["collscan"] for p in plans), "plans": plans}
+
+@api_router.post("/admin/user-cache/invalidate", dependencies=[Depends(require_admin)])
+async def invalidate_user_cache(user_id: Optional[str] = None):
+    invalidate_user(user_id)
+    return {"message": "User cache invalidated"}
+
 # Demo data initialization
 @api_router.post("/demo/init")
 async def initialize_demo_data():
@@ -637,7 +3522,7 @@ async def initialize_demo_data():
         }
     ]
     
-    await db.suppliers.insert_many(demo_suppliers)
+    await db.suppliers.insert_many([supplier_document(s) for s in demo_suppliers])
     
     # Create demo products with better variety and bulk pricing
     demo_products = []
@@ -700,8 +3585,47 @@ async def initialize_demo_data():
     
     await db.products.insert_many(demo_products)
     
+    for supplier_id, products in all_product_sets:
+        await db.suppliers.update_one(
+            {"id": supplier_id},
+            {"$set": {"categories": sorted({prod["category"] for prod in products})}}
+        )
+    
+    # Cached and revalidated catalog pages were built from the empty catalog
+    await bump_catalog_versions("*")
     return {"message": "Demo data initialized successfully"}
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_database()
+    # Index builds on large collections can take a while; don't hold up serving
+    start_background_task(ensure_indexes())
+    start_background_task(backfill_supplier_categories())
+    start_background_task(backfill_supplier_locations())
+    start_background_task(backfill_reserved_stock())
+    start_background_task(run_notification_fanout())
+    start_background_task(sweep_reservations_periodically())
+    if RATING_RECONCILE_INTERVAL_SECONDS > 0:
+        start_background_task(reconcile_supplier_ratings_periodically())
+    yield
+    # Background work is stopped before the client it uses is closed
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    client.close()
+    password_hasher.executor.shutdown(wait=False)
+
+# Create the main app without a prefix
+app = FastAPI(title="MicroMarket API", description="Digital Wholesale Marketplace API", lifespan=lifespan)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -711,15 +3635,72 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag", "Last-Modified"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Command line maintenance: python server.py <command>
+# Each command returns a JSON-serializable report and whether it succeeded
+async def cli_ensure_indexes():
+    status = await ensure_indexes()
+    return status, status["state"] == "ready"
+
+async def cli_explain():
+    plans = await explain_query_plans()
+    return plans, not any(p["collscan"] for p in plans)
+
+async def cli_rebuild_supplier_categories():
+    return await rebuild_supplier_categories(), True
+
+async def cli_rebuild_supplier_locations():
+    return await rebuild_supplier_locations(), True
+
+async def cli_rebuild_supplier_ratings():
+    return await rebuild_supplier_ratings(), True
+
+async def cli_rebuild_analytics():
+    return await rebuild_analytics_rollups(), True
+
+async def cli_rebuild_reserved_stock():
+    return await rebuild_reserved_stock(), True
+
+async def cli_rebuild_notification_counters():
+    return await rebuild_notification_counters(), True
+
+async def cli_seed(**options):
+    config = SeedConfig(**options)
+    reset_seed_status(config)
+    report = await seed_data(config)
+    return report, report["state"] == "done"
+
+CLI_COMMANDS = {
+    "ensure-indexes": cli_ensure_indexes,
+    "explain": cli_explain,
+    "rebuild-supplier-categories": cli_rebuild_supplier_categories,
+    "rebuild-supplier-locations": cli_rebuild_supplier_locations,
+    "rebuild-supplier-ratings": cli_rebuild_supplier_ratings,
+    "rebuild-analytics": cli_rebuild_analytics,
+    "rebuild-notification-counters": cli_rebuild_notification_counters,
+    "rebuild-reserved-stock": cli_rebuild_reserved_stock,
+    "seed": cli_seed,
+}
+
+async def run_cli_command(command: str, options: dict) -> bool:
+    connect_database()
+    try:
+        report, ok = await CLI_COMMANDS[command](**options)
+        print(json.dumps(report, indent=2, default=str))
+        return ok
+    finally:
+        client.close()
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MicroMarket maintenance commands")
+    parser.add_argument("command", choices=sorted(CLI_COMMANDS))
+    seeding = parser.add_argument_group("seed options")
+    for name, field in SeedConfig.__fields__.items():
+        seeding.add_argument(f"--{name.replace('_', '-')}", dest=name, type=type(field.default))
+    args = parser.parse_args()
+    options = {name: value for name, value in vars(args).items() if name != "command" and value is not None}
+    if options and args.command != "seed":
+        parser.error("seed options only apply to the seed command")
+    sys.exit(0 if asyncio.run(run_cli_command(args.command, options)) else 1)
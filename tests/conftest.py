@@ -0,0 +1,253 @@
+"""Fixtures running the API in-process against an in-memory mongomock database.
+
+mongomock covers the queries the server makes apart from the few gaps patched
+below. It has no sessions, so MockSession stands in for a transaction: it
+snapshots every collection when the transaction starts and restores them on abort.
+Run with the packages in requirements-dev.txt: python -m pytest tests
+"""
+import asyncio
+import copy
+import os
+import re
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from fastapi.testclient import TestClient
+from mongomock import aggregate, filtering
+from mongomock.collection import BulkOperationBuilder, Collection
+from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The response cache is process-wide and would carry catalog pages between tests
+os.environ["CATALOG_CACHE_BACKEND"] = "none"
+
+import server  # noqa: E402
+
+# mongomock gaps
+# Array literals in expressions are returned as-is instead of evaluated element-wise,
+# so [{"$literal": item}] in the cart update pipeline is stored verbatim
+_parse_basic_expression = aggregate._Parser._parse_basic_expression
+
+def parse_basic_expression(self, expression):
+    if isinstance(expression, list):
+        return list(self.parse_many(expression))
+    return _parse_basic_expression(self, expression)
+
+aggregate._Parser._parse_basic_expression = parse_basic_expression
+
+# $mergeObjects is not implemented, and $sum of an array-valued expression
+# (rather than a field path) evaluates to 0 instead of summing the elements
+_parse = aggregate._Parser.parse
+
+def parse(self, expression):
+    if isinstance(expression, dict) and list(expression) == ["$mergeObjects"]:
+        merged = {}
+        for part in self.parse_many(expression["$mergeObjects"]):
+            merged.update(part or {})
+        return merged
+    if isinstance(expression, dict) and list(expression) == ["$sum"] and isinstance(expression["$sum"], dict):
+        values = self.parse(expression["$sum"])
+        if isinstance(values, list):
+            return sum(value for value in values if isinstance(value, (int, float)))
+        return values if isinstance(values, (int, float)) else 0
+    return _parse(self, expression)
+
+aggregate._Parser.parse = parse
+
+# find_one_and_update re-reads the document by its filter rather than by _id when the
+# projection excludes _id, and the filter may no longer match after the update
+_find_and_modify = Collection._find_and_modify
+
+def find_and_modify(self, query, projection=None, update=None, upsert=False, sort=None, *args, **kwargs):
+    match = self.find_one(query, {"_id": 1}, sort=sort)
+    if match is not None:
+        query = {"_id": match["_id"]}
+    return _find_and_modify(self, query, projection, update, upsert, sort, *args, **kwargs)
+
+Collection._find_and_modify = find_and_modify
+
+# $all compares regular expressions by equality instead of matching them
+_all_op = filtering._Filterer._all_op
+
+def all_op(self, doc_val, search_val):
+    patterns = [value for value in search_val if isinstance(value, re.Pattern)]
+    values = doc_val if isinstance(doc_val, list) else [doc_val]
+    if values and isinstance(values[0], list):
+        values = [value for candidate in values for value in candidate]
+    return _all_op(self, doc_val, [value for value in search_val if value not in patterns]) and all(
+        any(isinstance(value, str) and pattern.search(value) for value in values) for pattern in patterns
+    )
+
+filtering._Filterer._all_op = all_op
+filtering._filterer_inst._operator_map["$all"] = all_op.__get__(filtering._filterer_inst)
+
+# pymongo's UpdateOne passes sort, which mongomock's bulk builder doesn't accept
+_add_update = BulkOperationBuilder.add_update
+
+def add_update(self, *args, sort=None, **kwargs):
+    return _add_update(self, *args, **kwargs)
+
+BulkOperationBuilder.add_update = add_update
+
+# with_options returns the bare mongomock collection instead of an async wrapper
+def with_options(self, **options):
+    return AsyncMongoMockCollection(self.database, self._AsyncMongoMockCollection__collection.with_options(**options))
+
+AsyncMongoMockCollection.with_options = with_options
+
+
+
+class MockSession:
+    def __init__(self, store):
+        self.store = store
+        self.snapshot = None
+
+    # mongomock rejects any truthy session= argument
+    def __bool__(self):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.in_transaction:
+            await self.abort_transaction()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.snapshot is not None
+
+    def collections(self):
+        for database in self.store._databases.values():
+            yield from database._collections.values()
+
+    def start_transaction(self, **options):
+        self.options = options
+        self.snapshot = {id(c): copy.deepcopy(c._documents) for c in self.collections()}
+
+    async def commit_transaction(self):
+        self.snapshot = None
+
+    async def abort_transaction(self):
+        for collection in self.collections():
+            collection._documents = self.snapshot.get(id(collection), type(collection._documents)())
+        self.snapshot = None
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongo = mongomock.MongoClient()
+    client = AsyncMongoMockClient(mock_mongo_client=mongo)
+    client.sessions = []
+
+    async def start_session():
+        client.sessions.append(MockSession(mongo._store))
+        return client.sessions[-1]
+
+    client.start_session = start_session
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", client["test"])
+    assert asyncio.run(server.ensure_indexes())["state"] == "ready"
+    server.user_cache.clear()
+    return server.db
+
+
+@pytest.fixture
+def api(db):
+    # Without the context manager the startup hooks (index build on the real client) don't run
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def make_user(db):
+    def make(user_type: str = "vendor") -> dict:
+        user = server.User(email=f"{uuid.uuid4().hex[:12]}@example.com", name="Test User", user_type=user_type)
+        asyncio.run(db.users.insert_one({**user.dict(), "password": "unused"}))
+        return {"user": user, "headers": {"Authorization": f"Bearer {server.create_jwt_token(user)}"}}
+    return make
+
+
+@pytest.fixture
+def vendor(make_user) -> dict:
+    return make_user("vendor")
+
+
+@pytest.fixture
+def supplier(db, make_user) -> dict:
+    supplier = make_user("supplier")
+    profile = server.Supplier(id="supplier-1", user_id=supplier["user"].id, stall_name="Stall", description="",
+                              image_url="", contact_phone="", location="Central Market")
+    asyncio.run(db.suppliers.insert_one(server.supplier_document(profile.dict())))
+    return supplier
+
+
+@pytest.fixture
+def make_product(db):
+    def make(quantity_available: int = 10, price_per_unit: float = 2.0, supplier_id: str = "supplier-1", **fields) -> dict:
+        now = datetime.utcnow()
+        product = {
+            "id": str(uuid.uuid4()),
+            "supplier_id": supplier_id,
+            "name": "Tomatoes",
+            "category": "Vegetables",
+            "price_per_unit": price_per_unit,
+            "unit": "kg",
+            "quantity_available": quantity_available,
+            "bulk_discount_tiers": [],
+            "image_url": "",
+            "description": "",
+            "created_at": now,
+            "updated_at": now,
+            **fields
+        }
+        asyncio.run(db.products.insert_one(dict(product)))
+        return product
+    return make
+
+
+@pytest.fixture
+def add_to_cart(api):
+    def add(vendor: dict, product: dict, quantity: int, **params):
+        return api.post("/api/cart/add", headers=vendor["headers"], params=params, json={
+            "product_id": product["id"], "supplier_id": product["supplier_id"],
+            "quantity": quantity, "price_per_unit": product["price_per_unit"]
+        })
+    return add
+
+
+@pytest.fixture
+def get_cart(api):
+    def get(vendor: dict) -> dict:
+        response = api.get("/api/cart", headers=vendor["headers"])
+        assert response.status_code == 200, response.text
+        return response.json()
+    return get
+
+
+@pytest.fixture
+def stock(db):
+    def get(product_id: str) -> int:
+        return asyncio.run(db.products.find_one({"id": product_id}))["quantity_available"]
+    return get
+
+
+@pytest.fixture
+def held(db):
+    def get(vendor_id: str, product_id: str) -> int:
+        hold = asyncio.run(db.reservations.find_one({"vendor_id": vendor_id, "product_id": product_id, "status": "held"}))
+        return hold["quantity"] if hold else 0
+    return get
+
+
+@pytest.fixture
+def expire_holds(db):
+    def expire(vendor_id: str):
+        asyncio.run(db.reservations.update_many(
+            {"vendor_id": vendor_id},
+            {"$set": {"expires_at": datetime.utcnow() - timedelta(minutes=1)}}
+        ))
+    return expire
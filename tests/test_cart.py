@@ -0,0 +1,218 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def lines(cart: dict) -> dict:
+    return {line["product_id"]: line["quantity"] for line in cart["items"]}
+
+
+def update(api, vendor, product, quantity: int, **params):
+    return api.put(f"/api/cart/update/{product['id']}", headers=vendor["headers"],
+                   params={"quantity": quantity, **params})
+
+
+def remove(api, vendor, product, **params):
+    return api.delete(f"/api/cart/remove/{product['id']}", headers=vendor["headers"], params=params)
+
+
+def test_add_creates_the_cart(db, vendor, make_product, add_to_cart, get_cart, stock, held):
+    product = make_product(price_per_unit=2.5)
+
+    response = add_to_cart(vendor, product, 3)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["version"] == 1
+    cart = get_cart(vendor)
+    assert lines(cart) == {product["id"]: 3}
+    assert cart["total_amount"] == 7.5
+    assert asyncio.run(db.carts.count_documents({})) == 1
+    assert stock(product["id"]) == 7
+    assert held(vendor["user"].id, product["id"]) == 3
+
+
+def test_add_prices_from_the_product(vendor, make_product, add_to_cart, get_cart):
+    product = make_product(price_per_unit=2.5)
+
+    add_to_cart(vendor, {**product, "price_per_unit": 0.01, "supplier_id": "ignored"}, 1)
+
+    [line] = get_cart(vendor)["items"]
+    assert line["price_per_unit"] == 2.5
+    assert line["supplier_id"] == product["supplier_id"]
+
+
+def test_add_beyond_stock_is_rejected(db, vendor, make_product, add_to_cart, stock):
+    product = make_product(quantity_available=2)
+
+    assert add_to_cart(vendor, product, 3).status_code == 409
+    assert stock(product["id"]) == 2
+    assert asyncio.run(db.carts.count_documents({})) == 0
+
+
+def test_adding_again_merges_the_line(vendor, make_product, add_to_cart, get_cart):
+    first = make_product(price_per_unit=2.0)
+    second = make_product(price_per_unit=1.0)
+
+    add_to_cart(vendor, first, 3)
+    add_to_cart(vendor, second, 1)
+    response = add_to_cart(vendor, first, 2)
+
+    assert response.json()["version"] == 3
+    cart = get_cart(vendor)
+    assert lines(cart) == {first["id"]: 5, second["id"]: 1}
+    assert cart["total_amount"] == 11.0
+
+
+def test_stale_add_is_rejected_and_releases_its_hold(vendor, make_product, add_to_cart, get_cart, stock):
+    product = make_product()
+    add_to_cart(vendor, product, 1)
+
+    assert add_to_cart(vendor, product, 3, expected_version=0).status_code == 409
+    assert stock(product["id"]) == 9
+    assert add_to_cart(vendor, product, 3, expected_version=1).status_code == 200
+    assert lines(get_cart(vendor)) == {product["id"]: 4}
+    assert stock(product["id"]) == 6
+
+
+def test_failed_cart_write_releases_its_hold(db, vendor, make_product, stock, held, monkeypatch):
+    product = make_product()
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("cart write failed")
+
+    monkeypatch.setattr(server, "update_cart", broken)
+    response = TestClient(server.app, raise_server_exceptions=False).post(
+        "/api/cart/add", headers=vendor["headers"],
+        json={"product_id": product["id"], "supplier_id": product["supplier_id"], "quantity": 3, "price_per_unit": 2.0}
+    )
+
+    assert response.status_code == 500
+    assert stock(product["id"]) == 10
+    assert held(vendor["user"].id, product["id"]) == 0
+
+
+def test_remove_drops_the_line_and_its_hold(api, vendor, make_product, add_to_cart, get_cart, stock):
+    kept = make_product()
+    removed = make_product()
+    add_to_cart(vendor, kept, 1)
+    add_to_cart(vendor, removed, 4)
+
+    response = remove(api, vendor, removed)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["version"] == 3
+    cart = get_cart(vendor)
+    assert lines(cart) == {kept["id"]: 1}
+    assert cart["total_amount"] == 2.0
+    assert stock(removed["id"]) == 10
+    assert stock(kept["id"]) == 9
+
+
+def test_remove_reports_what_is_missing(api, vendor, make_product, add_to_cart):
+    product = make_product()
+    assert remove(api, vendor, product).status_code == 404
+    add_to_cart(vendor, product, 1)
+    assert remove(api, vendor, make_product()).status_code == 404
+    assert remove(api, vendor, product, expected_version=5).status_code == 409
+
+
+def test_update_adjusts_the_hold_by_the_difference(api, vendor, make_product, add_to_cart, get_cart, stock, held):
+    product = make_product(price_per_unit=2.0)
+    add_to_cart(vendor, product, 4)
+
+    response = update(api, vendor, product, 7)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["version"] == 2
+    cart = get_cart(vendor)
+    assert lines(cart) == {product["id"]: 7}
+    assert cart["total_amount"] == 14.0
+    assert stock(product["id"]) == 3
+
+    assert update(api, vendor, product, 2).status_code == 200
+    assert stock(product["id"]) == 8
+    assert held(vendor["user"].id, product["id"]) == 2
+
+
+def test_update_to_zero_removes_the_line(api, vendor, make_product, add_to_cart, get_cart, stock, held):
+    product = make_product()
+    add_to_cart(vendor, product, 4)
+
+    assert update(api, vendor, product, 0).status_code == 200
+    assert get_cart(vendor)["items"] == []
+    assert stock(product["id"]) == 10
+    assert held(vendor["user"].id, product["id"]) == 0
+
+
+def test_update_beyond_stock_leaves_the_cart_alone(api, vendor, make_product, add_to_cart, get_cart, stock, held):
+    product = make_product(quantity_available=5)
+    add_to_cart(vendor, product, 4)
+
+    assert update(api, vendor, product, 6).status_code == 409
+    assert lines(get_cart(vendor)) == {product["id"]: 4}
+    assert stock(product["id"]) == 1
+    assert held(vendor["user"].id, product["id"]) == 4
+
+
+def test_stale_update_is_rejected(api, vendor, make_product, add_to_cart, get_cart, stock):
+    product = make_product()
+    add_to_cart(vendor, product, 4)
+
+    assert update(api, vendor, product, 6, expected_version=0).status_code == 409
+    assert update(api, vendor, product, 6, expected_version=1).status_code == 200
+    assert lines(get_cart(vendor)) == {product["id"]: 6}
+    assert stock(product["id"]) == 4
+
+
+def test_update_of_a_missing_line(api, vendor, make_product, add_to_cart):
+    product = make_product()
+    assert update(api, vendor, product, 2).status_code == 404
+    add_to_cart(vendor, product, 1)
+    assert update(api, vendor, make_product(), 2).status_code == 404
+
+
+def test_cart_flags_price_changes(db, vendor, make_product, add_to_cart, get_cart):
+    product = make_product(price_per_unit=2.0)
+    add_to_cart(vendor, product, 1)
+    asyncio.run(db.products.update_one({"id": product["id"]}, {"$set": {"price_per_unit": 2.5}}))
+
+    cart = get_cart(vendor)
+
+    assert cart["items"][0]["current_price"] == 2.5
+    assert cart["items"][0]["price_changed"] is True
+    assert cart["has_changes"] is True
+
+
+def test_cart_counts_the_vendors_own_holds_as_available(vendor, make_product, add_to_cart, get_cart):
+    product = make_product(quantity_available=5)
+    add_to_cart(vendor, product, 5)
+
+    [line] = get_cart(vendor)["items"]
+
+    # quantity_available is what's left for others; the vendor's line is still covered
+    assert line["quantity_available"] == 0
+    assert line["available"] is True
+
+
+def test_cart_applies_bulk_discounts(vendor, make_product, add_to_cart, get_cart):
+    product = make_product(quantity_available=50, price_per_unit=2.0,
+                           bulk_discount_tiers=[{"min_qty": 10, "discount": 0.1}, {"min_qty": 20, "discount": 0.2}])
+    add_to_cart(vendor, product, 10)
+
+    cart = get_cart(vendor)
+
+    assert cart["items"][0]["discount_rate"] == 0.1
+    assert cart["subtotal"] == 20.0
+    assert cart["discount_amount"] == 2.0
+    assert cart["total_amount"] == 18.0
+
+
+def test_malformed_stored_tiers_are_ignored(api, vendor, make_product, add_to_cart, get_cart):
+    product = make_product(price_per_unit=2.0,
+                           bulk_discount_tiers=[{"min_qty": "ten", "discount": 0.5}, {"min_qty": 2, "discount": 0.1}])
+    add_to_cart(vendor, product, 2)
+
+    assert get_cart(vendor)["total_amount"] == 3.6
+    assert api.post("/api/checkout", headers=vendor["headers"]).status_code == 200
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('"v1"', True),
+    ('W/"v1"', True),
+    ('"v0", W/"v1" ', True),
+    ('"v2"', False),
+    ('v1', False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert server.etag_matches(if_none_match, 'W/"v1"') is expected
+
+
+def test_catalog_lists_revalidate_until_the_catalog_changes(api):
+    etag = api.get("/api/suppliers").headers["ETag"]
+
+    assert api.get("/api/suppliers", headers={"If-None-Match": etag}).status_code == 304
+
+    asyncio.run(server.bump_catalog_versions("suppliers"))
+    response = api.get("/api/suppliers", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_response_shape_select_narrows_the_projection():
+    shape = server.PRODUCT_SHAPE.select(" price_per_unit,name,, name")
+
+    assert shape.fields == ["id", "name", "price_per_unit"]
+    assert shape.projection == {"id": 1, "name": 1, "price_per_unit": 1}
+    assert shape.selection == "id,name,price_per_unit"
+    assert server.PRODUCT_SHAPE.select(None) is server.PRODUCT_SHAPE
+    assert server.PRODUCT_SHAPE.select("") is server.PRODUCT_SHAPE
+
+
+def test_response_shape_select_rejects_unknown_fields():
+    with pytest.raises(server.HTTPException) as exc:
+        server.PRODUCT_SHAPE.select("name,password")
+
+    assert exc.value.status_code == 400
+    assert "password" in exc.value.detail
+
+
+def test_response_shape_drops_unknown_keys_from_nested_items():
+    shape = server.ORDER_SHAPE.select("items")
+
+    [item] = shape.document({"_id": "x", "id": "o", "items": [{"product_id": "p", "secret": 1}]})["items"]
+
+    assert "secret" not in item and item["product_id"] == "p"
+
+
+def test_list_endpoints_return_sparse_fieldsets(api, make_product):
+    make_product(supplier_id="s1", price_per_unit=3.0)
+
+    response = api.get("/api/suppliers/s1/products", params={"fields": "price_per_unit"})
+
+    assert response.status_code == 200, response.text
+    assert [set(product) for product in response.json()] == [{"id", "price_per_unit"}]
+    assert api.get("/api/suppliers/s1/products", params={"fields": "nope"}).status_code == 400
+
+
+def test_memory_cache_is_bounded_by_bytes():
+    backend = server.MemoryCacheBackend(max_bytes=10, ttl=60)
+
+    asyncio.run(backend.set("a", b"1234"))
+    asyncio.run(backend.set("b", b"1234"))
+    asyncio.run(backend.get("a"))
+    asyncio.run(backend.set("c", b"1234"))
+
+    assert asyncio.run(backend.get("b")) is None
+    assert asyncio.run(backend.get("a")) == asyncio.run(backend.get("c")) == b"1234"
+    assert backend.metrics()["weight"] == 8
+    asyncio.run(backend.set("a", b"12"))
+    assert backend.metrics()["weight"] == 6
+
+
+def test_memory_cache_skips_entries_larger_than_the_bound():
+    backend = server.MemoryCacheBackend(max_bytes=10, ttl=60)
+    asyncio.run(backend.set("small", b"1234"))
+
+    asyncio.run(backend.set("large", b"x" * 11))
+
+    assert asyncio.run(backend.get("large")) is None
+    assert asyncio.run(backend.get("small")) == b"1234"
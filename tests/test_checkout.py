@@ -0,0 +1,173 @@
+import asyncio
+
+from pymongo import ReadPreference
+from pymongo.errors import PyMongoError
+
+import server
+
+
+def checkout(api, vendor, **params):
+    return api.post("/api/checkout", headers=vendor["headers"], params=params)
+
+
+def reserved(db, product) -> int:
+    return asyncio.run(db.products.find_one({"id": product["id"]}))["quantity_reserved"]
+
+
+def test_checkout_converts_holds_without_taking_stock_again(api, db, vendor, make_product, add_to_cart, get_cart,
+                                                            stock, held):
+    product = make_product(quantity_available=10)
+    add_to_cart(vendor, product, 4)
+
+    response = checkout(api, vendor)
+
+    assert response.status_code == 200, response.text
+    assert stock(product["id"]) == 6
+    assert held(vendor["user"].id, product["id"]) == 0
+    assert reserved(db, product) == 0
+    assert asyncio.run(db.reservations.count_documents({"status": "converted"})) == 1
+    cart = get_cart(vendor)
+    assert cart["items"] == [] and cart["version"] == 2
+
+
+def test_checkout_takes_stock_for_an_expired_hold(api, vendor, make_product, add_to_cart, stock, expire_holds):
+    product = make_product(quantity_available=10)
+    add_to_cart(vendor, product, 4)
+    expire_holds(vendor["user"].id)
+    asyncio.run(server.sweep_expired_reservations())
+    assert stock(product["id"]) == 10
+
+    assert checkout(api, vendor).status_code == 200
+    assert stock(product["id"]) == 6
+
+
+def test_checkout_takes_only_the_unheld_remainder(api, db, vendor, make_product, add_to_cart, stock):
+    product = make_product(quantity_available=10)
+    add_to_cart(vendor, product, 4)
+    # The cart asks for more than the hold covers, e.g. after a partial release
+    asyncio.run(db.reservations.update_many({}, {"$set": {"quantity": 1}}))
+    asyncio.run(db.products.update_one({"id": product["id"]}, {"$inc": {"quantity_available": 3, "quantity_reserved": -3}}))
+
+    assert checkout(api, vendor).status_code == 200
+    assert stock(product["id"]) == 6
+    assert reserved(db, product) == 0
+
+
+def test_checkout_returns_holds_for_products_no_longer_in_the_cart(api, db, vendor, make_product, add_to_cart, stock,
+                                                                   held):
+    kept = make_product(quantity_available=10)
+    dropped = make_product(quantity_available=10)
+    add_to_cart(vendor, kept, 2)
+    add_to_cart(vendor, dropped, 3)
+    # Line removed without releasing its hold
+    asyncio.run(db.carts.update_one({}, {"$pull": {"items": {"product_id": dropped["id"]}}}))
+
+    assert checkout(api, vendor).status_code == 200
+    assert stock(kept["id"]) == 8
+    assert stock(dropped["id"]) == 10
+    assert held(vendor["user"].id, dropped["id"]) == 0
+    assert reserved(db, kept) == reserved(db, dropped) == 0
+
+
+def test_checkout_splits_orders_per_supplier(api, db, vendor, make_product, add_to_cart):
+    first = make_product(supplier_id="s1", price_per_unit=2.0)
+    second = make_product(supplier_id="s1", price_per_unit=0.5)
+    third = make_product(supplier_id="s2", price_per_unit=3.0)
+    add_to_cart(vendor, first, 5)
+    add_to_cart(vendor, second, 2)
+    add_to_cart(vendor, third, 1)
+
+    result = checkout(api, vendor).json()
+
+    orders = {order["supplier_id"]: order for order in result["orders"]}
+    assert [item["product_id"] for item in orders["s1"]["items"]] == [first["id"], second["id"]]
+    assert orders["s1"]["total_amount"] == 11.0
+    assert orders["s2"]["total_amount"] == 3.0
+    assert result["total_amount"] == 14.0
+    assert asyncio.run(db.orders.count_documents({"vendor_id": vendor["user"].id})) == 2
+
+
+def test_checkout_total_is_rounded_to_cents(api, vendor, make_product, add_to_cart):
+    add_to_cart(vendor, make_product(supplier_id="s1", price_per_unit=0.1), 1)
+    add_to_cart(vendor, make_product(supplier_id="s2", price_per_unit=0.2), 1)
+
+    assert checkout(api, vendor).json()["total_amount"] == 0.3
+
+
+def test_checkout_prices_at_the_current_price(api, db, vendor, make_product, add_to_cart):
+    product = make_product(price_per_unit=2.0)
+    add_to_cart(vendor, product, 2)
+    asyncio.run(db.products.update_one({"id": product["id"]}, {"$set": {"price_per_unit": 3.0}}))
+
+    [order] = checkout(api, vendor).json()["orders"]
+
+    assert order["items"][0]["price_per_unit"] == 3.0
+    assert order["total_amount"] == 6.0
+
+
+def test_checkout_short_of_stock_changes_nothing(api, db, vendor, make_product, add_to_cart, get_cart, stock,
+                                                expire_holds):
+    plenty = make_product(quantity_available=10)
+    scarce = make_product(quantity_available=5)
+    add_to_cart(vendor, plenty, 2)
+    add_to_cart(vendor, scarce, 4)
+    expire_holds(vendor["user"].id)
+    asyncio.run(server.sweep_expired_reservations())
+    # Someone else buys the scarce stock while the holds were expired
+    asyncio.run(db.products.update_one({"id": scarce["id"]}, {"$set": {"quantity_available": 1}}))
+
+    response = checkout(api, vendor)
+
+    assert response.status_code == 409
+    assert response.json()["detail"]["product_ids"] == [scarce["id"]]
+    assert stock(plenty["id"]) == 10
+    assert stock(scarce["id"]) == 1
+    assert asyncio.run(db.orders.count_documents({})) == 0
+    assert len(get_cart(vendor)["items"]) == 2
+
+
+def test_failed_checkout_is_rolled_back(api, db, vendor, make_product, add_to_cart, get_cart, stock, held,
+                                       monkeypatch):
+    product = make_product(quantity_available=10)
+    add_to_cart(vendor, product, 4)
+
+    async def failing_insert(*args, **kwargs):
+        raise PyMongoError("insert failed")
+
+    monkeypatch.setattr(type(db.orders), "insert_many", failing_insert)
+    response = checkout(api, vendor)
+
+    assert response.status_code == 503
+    assert stock(product["id"]) == 6
+    assert held(vendor["user"].id, product["id"]) == 4
+    assert len(get_cart(vendor)["items"]) == 1
+
+
+def test_checkout_reads_from_the_primary_whatever_the_catalog_preference(api, vendor, make_product, add_to_cart,
+                                                                           monkeypatch):
+    monkeypatch.setattr(server, "CATALOG_READ_PREFERENCE", ReadPreference.SECONDARY_PREFERRED)
+    add_to_cart(vendor, make_product(), 1)
+
+    assert checkout(api, vendor).status_code == 200
+    [session] = server.client.sessions
+    assert session.options["read_preference"] == ReadPreference.PRIMARY
+    assert server.catalog_collection("products").read_preference == ReadPreference.SECONDARY_PREFERRED
+    assert server.db.products.read_preference == ReadPreference.PRIMARY
+
+
+def test_checkout_checks_the_cart_version(api, vendor, make_product, add_to_cart, stock, held):
+    product = make_product(quantity_available=10)
+    add_to_cart(vendor, product, 1)
+
+    assert checkout(api, vendor, expected_version=0).status_code == 409
+    assert stock(product["id"]) == 9
+    assert held(vendor["user"].id, product["id"]) == 1
+    assert checkout(api, vendor, expected_version=1).status_code == 200
+
+
+def test_only_vendors_check_out(api, make_user):
+    assert checkout(api, make_user("supplier")).status_code == 403
+
+
+def test_checkout_of_an_empty_cart(api, vendor):
+    assert checkout(api, vendor).status_code == 400
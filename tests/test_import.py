@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def records(*lines) -> list:
+    async def source():
+        for line in lines:
+            yield line
+
+    async def collect():
+        return [record async for record in server.csv_records(source())]
+
+    return asyncio.run(collect())
+
+
+HEADER = "name,category,price_per_unit,unit,quantity_available,bulk_discount_tiers,image_url,description"
+
+
+def test_csv_records_map_columns_and_parse_tiers():
+    [(row, record)] = records(HEADER, 'Onions,Vegetables,2,kg,5,"[{""min_qty"": 5, ""discount"": 0.1}]",,Red')
+
+    assert row == 1
+    assert record["name"] == "Onions"
+    assert record["bulk_discount_tiers"] == [{"min_qty": 5, "discount": 0.1}]
+
+
+def test_csv_records_join_quoted_fields_across_lines():
+    [(_, record)] = records(HEADER, 'Onions,Vegetables,2,kg,5,,,"Red', 'and sweet"')
+
+    assert record["description"] == "Red\nand sweet"
+
+
+def test_csv_records_report_bad_rows_and_carry_on():
+    result = records(HEADER, "", "Onions,Vegetables", "Leeks,Vegetables,2,kg,5,[oops,,", "Kale,Vegetables,2,kg,5,,,")
+
+    assert result[0] == (1, "Expected 8 columns, got 2")
+    assert result[1] == (2, "bulk_discount_tiers: invalid JSON")
+    assert result[2][1]["name"] == "Kale"
+
+
+def test_csv_records_keep_quotes_inside_unquoted_fields_literal():
+    result = records(HEADER, 'Pipe 5" wide,Hardware,2,pc,1,,,x', "Tape,Hardware,1,pc,3,,,y")
+
+    assert [record["name"] for _, record in result] == ['Pipe 5" wide', "Tape"]
+
+
+def test_csv_records_report_malformed_quoting_and_carry_on():
+    result = records(HEADER, '"Pipe" 5,Hardware,2,pc,1,,,x', "Tape,Hardware,1,pc,3,,,y")
+
+    assert result[0][1].startswith("Invalid CSV")
+    assert result[1] == (2, {**result[1][1], "name": "Tape"})
+
+
+def test_csv_records_reject_rows_longer_than_the_limit(monkeypatch):
+    monkeypatch.setattr(server, "MAX_IMPORT_LINE_LENGTH", 200)
+    lines = [HEADER, 'Onions,Vegetables,2,kg,5,,,"Red'] + ["and sweet"] * 30 + ['"']
+
+    with pytest.raises(HTTPException) as exc:
+        records(*lines)
+    assert exc.value.status_code == 413
+
+
+def test_csv_records_report_an_unterminated_quote():
+    assert records(HEADER, 'Onions,Vegetables,2,kg,5,,,"Red')[-1] == (1, "Unterminated quoted field")
+
+
+def test_import_creates_new_products(api, db, supplier):
+    response = api.post("/api/products/import", headers={**supplier["headers"], "Content-Type": "text/csv"},
+                        content=f"{HEADER}\nOnions,Vegetables,2,kg,5,,,Red\n")
+
+    assert response.json()["created"] == 1, response.text
+    product = asyncio.run(db.products.find_one({"name": "Onions"}))
+    assert product["quantity_available"] == 5
+    assert product["id"] and product["created_at"] == product["updated_at"]
@@ -0,0 +1,53 @@
+import asyncio
+
+import server
+
+
+def insert_supplier(db, location: str):
+    supplier = server.Supplier(user_id=location, stall_name=location, description="", image_url="",
+                               contact_phone="", location=location)
+    asyncio.run(db.suppliers.insert_one(server.supplier_document(supplier.dict())))
+
+
+def test_location_tokens_are_lowercase_words_without_repeats():
+    assert server.location_tokens("Central Market, Stall 12-B central") == ["central", "market", "stall", "12", "b"]
+    assert server.location_tokens(" -- ") == []
+
+
+def test_location_filter_matches_the_last_token_as_a_prefix():
+    query = server.location_filter("Central Mar")["location_tokens"]["$all"]
+
+    assert query[0] == "central"
+    assert query[1].pattern == "^mar"
+    assert server.location_filter(" , ") == {}
+
+
+def test_supplier_document_adds_the_indexed_fields():
+    supplier = server.supplier_document({"location": "North Zone", "latitude": 12.5, "longitude": 77.25})
+
+    assert supplier["location_tokens"] == ["north", "zone"]
+    assert supplier["geo"] == {"type": "Point", "coordinates": [77.25, 12.5]}
+    assert "geo" not in server.supplier_document({"location": "North Zone", "latitude": None, "longitude": None})
+
+
+def test_suppliers_filter_by_location(api, db):
+    for location in ["Central Market", "Central Station", "North Market"]:
+        insert_supplier(db, location)
+
+    found = api.get("/api/suppliers", params={"location": "central mark"}).json()
+
+    assert [supplier["location"] for supplier in found] == ["Central Market"]
+
+
+def test_locations_are_backfilled_for_suppliers_that_predate_them(api, db):
+    asyncio.run(db.suppliers.insert_many([
+        {"id": "s1", "user_id": "u1", "stall_name": "Old", "location": "Central Market", "latitude": 1.5, "longitude": 2.5},
+        {"id": "s2", "user_id": "u2", "stall_name": "Old", "location": "North Market"}
+    ]))
+
+    assert asyncio.run(server.backfill_supplier_locations())["suppliers_updated"] == 2
+
+    found = api.get("/api/suppliers", params={"location": "central"}).json()
+    assert [supplier["id"] for supplier in found] == ["s1"]
+    assert asyncio.run(db.suppliers.find_one({"id": "s1"}))["geo"] == {"type": "Point", "coordinates": [2.5, 1.5]}
+    assert asyncio.run(server.backfill_supplier_locations()) is None
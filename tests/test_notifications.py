@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def redeem(ticket: str):
+    return asyncio.run(server.get_stream_user(ticket=ticket, credentials=None))
+
+
+def test_stream_tickets_are_single_use(api, db, vendor):
+    response = api.post("/api/notifications/stream-token", headers=vendor["headers"])
+
+    assert response.status_code == 200, response.text
+    ticket = response.json()["ticket"]
+    assert response.json()["expires_in"] == server.STREAM_TICKET_TTL_SECONDS
+    assert asyncio.run(db.stream_tickets.find_one({}))["ticket_hash"] != ticket
+    assert redeem(ticket).id == vendor["user"].id
+    with pytest.raises(HTTPException) as exc:
+        redeem(ticket)
+    assert exc.value.status_code == 401
+
+
+def test_expired_stream_tickets_are_rejected(db, vendor):
+    ticket = asyncio.run(server.issue_stream_ticket(vendor["user"].id))
+    asyncio.run(db.stream_tickets.update_many({}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}))
+
+    with pytest.raises(HTTPException) as exc:
+        redeem(ticket)
+    assert exc.value.status_code == 401
+
+
+def test_stream_rejects_tokens_in_the_url(api, vendor):
+    token = vendor["headers"]["Authorization"].removeprefix("Bearer ")
+
+    assert api.get("/api/notifications/stream", params={"token": token}).status_code == 401
+
+
+def notify(db, user_id: str, count: int, is_read: bool = False) -> list:
+    notifications = [server.Notification(user_id=user_id, title="Price drop", message="", type="price_drop",
+                                         is_read=is_read) for _ in range(count)]
+    asyncio.run(db.notifications.insert_many([n.dict() for n in notifications]))
+    return notifications
+
+
+def unread(api, user) -> int:
+    return api.get("/api/notifications/unread-count", headers=user["headers"]).json()["unread"]
+
+
+def test_reading_before_the_counter_exists_does_not_create_it(api, db, vendor):
+    [first, _, _] = notify(db, vendor["user"].id, 3)
+
+    assert api.put(f"/api/notifications/{first.id}/read", headers=vendor["headers"]).status_code == 200
+
+    assert asyncio.run(db.notification_counters.count_documents({})) == 0
+    assert unread(api, vendor) == 2
+
+
+def test_counter_follows_reads_and_unreads(api, db, vendor):
+    notifications = notify(db, vendor["user"].id, 3)
+    assert unread(api, vendor) == 3
+
+    api.post("/api/notifications/bulk", headers=vendor["headers"],
+             json={"action": "read", "ids": [n.id for n in notifications[:2]]})
+    assert unread(api, vendor) == 1
+    api.post("/api/notifications/bulk", headers=vendor["headers"], json={"action": "unread", "ids": [notifications[0].id]})
+    assert unread(api, vendor) == 2
+
+
+def test_negative_counters_are_not_hidden(api, db, vendor):
+    asyncio.run(db.notification_counters.insert_one({"user_id": vendor["user"].id, "unread": -2}))
+
+    assert unread(api, vendor) == -2
@@ -0,0 +1,44 @@
+import pytest
+from pydantic import ValidationError
+
+import server
+
+
+def test_tier_schedule_picks_the_highest_tier_reached():
+    schedule = server.TierSchedule([{"min_qty": 20, "discount": 0.2}, {"min_qty": 10, "discount": 0.1}])
+
+    assert [schedule.discount_for(quantity) for quantity in (1, 9, 10, 19, 20, 500)] == [0, 0, 0.1, 0.1, 0.2, 0.2]
+
+
+def test_tier_schedule_never_lowers_the_discount_for_larger_orders():
+    schedule = server.TierSchedule([{"min_qty": 5, "discount": 0.3}, {"min_qty": 10, "discount": 0.1}])
+
+    assert schedule.discount_for(10) == 0.3
+
+
+def test_tier_schedule_skips_malformed_tiers_and_clamps_discounts():
+    schedule = server.TierSchedule([
+        {"min_qty": "ten", "discount": 0.5},
+        {"discount": 0.5},
+        None,
+        {"min_qty": 2, "discount": 1.5}
+    ])
+
+    assert schedule.min_quantities == [2]
+    assert schedule.discount_for(2) == 1.0
+    assert server.TierSchedule(None).discount_for(100) == 0.0
+
+
+def test_price_line_rounds_each_amount():
+    product = {"id": "p", "price_per_unit": 0.33, "bulk_discount_tiers": [{"min_qty": 3, "discount": 0.15}]}
+
+    line = server.pricing_engine.price_line(product, 3)
+
+    assert line == {"unit_price": 0.33, "discount_rate": 0.15, "subtotal": 0.99,
+                    "discount_amount": 0.15, "total": 0.84}
+
+
+@pytest.mark.parametrize("tier", [{"min_qty": 0, "discount": 0.1}, {"min_qty": 5, "discount": 1.5}])
+def test_bulk_discount_tiers_are_validated(tier):
+    with pytest.raises(ValidationError):
+        server.BulkDiscountTier(**tier)
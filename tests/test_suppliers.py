@@ -0,0 +1,54 @@
+import asyncio
+
+import server
+
+
+def test_categories_are_backfilled_for_suppliers_that_predate_them(api, db, make_product):
+    asyncio.run(db.suppliers.insert_many([
+        {"id": "s1", "user_id": "u1", "stall_name": "Old", "location": "North"},
+        {"id": "s2", "user_id": "u2", "stall_name": "Empty", "location": "North"}
+    ]))
+    make_product(supplier_id="s1", category="Fruits")
+
+    report = asyncio.run(server.backfill_supplier_categories())
+
+    assert report["suppliers_updated"] == 1
+    assert [supplier["id"] for supplier in api.get("/api/suppliers", params={"category": "Fruits"}).json()] == ["s1"]
+    assert asyncio.run(db.suppliers.find_one({"id": "s2"}))["categories"] == []
+    # Every supplier now has the field, so later startups skip the rebuild
+    assert asyncio.run(server.backfill_supplier_categories()) is None
+
+
+def test_flush_in_batches_writes_every_operation(db, monkeypatch):
+    monkeypatch.setattr(server, "REBUILD_BATCH_SIZE", 2)
+    asyncio.run(db.suppliers.insert_many([{"id": f"s{n}", "user_id": f"u{n}", "rating": 0} for n in range(5)]))
+    suppliers = db.suppliers
+    writes = []
+    bulk_write = suppliers.bulk_write
+
+    async def counting_bulk_write(operations, **kwargs):
+        writes.append(len(operations))
+        return await bulk_write(operations, **kwargs)
+
+    monkeypatch.setattr(suppliers, "bulk_write", counting_bulk_write)
+
+    async def operations():
+        for n in range(5):
+            yield server.UpdateOne({"id": f"s{n}"}, {"$set": {"rating": 5}})
+
+    assert asyncio.run(server.flush_in_batches(suppliers, operations())) == 5
+    assert writes == [2, 2, 1]
+
+
+def test_rebuild_supplier_ratings_recomputes_from_reviews(db, monkeypatch):
+    monkeypatch.setattr(server, "REBUILD_BATCH_SIZE", 1)
+    asyncio.run(db.suppliers.insert_many([{"id": "s1", "user_id": "u1", "rating": 0}, {"id": "s2", "user_id": "u2", "rating": 0}]))
+    asyncio.run(db.reviews.insert_many([
+        {"id": str(n), "supplier_id": supplier_id, "vendor_id": f"v{n}", "rating": rating}
+        for n, (supplier_id, rating) in enumerate([("s1", 4), ("s1", 5), ("s2", 1)])
+    ]))
+
+    assert asyncio.run(server.rebuild_supplier_ratings()) == {"suppliers_updated": 2}
+
+    s1 = asyncio.run(db.suppliers.find_one({"id": "s1"}))
+    assert (s1["rating"], s1["total_reviews"], s1["rating_histogram"]["5"]) == (4.5, 2, 1)